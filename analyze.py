@@ -3,6 +3,7 @@ import json
 
 import numpy as np
 from scipy import stats
+from src.plotting import downsample, render_figures
 
 
 with open('./results/output_12-15_17-02.json', 'r') as file:
@@ -14,19 +15,37 @@ metrics = ['Duplicate ACK', 'Sequential Ack', 'Throughput', 'RTT', 'Jitter']
 colors = ['#CDC1FF', '#074799', '#FF748B']
 
 
+# Failed runs of a distributed grid are kept as None so run indices stay paired
+def completed_runs(values):
+    """(run numbers, values) of the runs that produced a result."""
+    runs = [(r + 1, v) for r, v in enumerate(values) if v is not None]
+    return [r for r, _ in runs], [v for _, v in runs]
+
+
+def paired_runs(level, metric):
+    """Reno and Cubic values of the runs (same seed) where both produced a result."""
+    pairs = [(reno, cubic) for reno, cubic in zip(data['reno'][level][metric], data['cubic'][level][metric])
+             if reno is not None and cubic is not None]
+    return np.array([p[0] for p in pairs], dtype=float), np.array([p[1] for p in pairs], dtype=float)
+
+
 def draw_cwnd(cc_alg='reno', level='low', lines_cnt=5):
     plt.figure(figsize=(10, 6))  # 设置图表尺寸
 
 
+    times = data[cc_alg][level].get('CWND Time')
     for idx, sublist in enumerate(data[cc_alg][level]['CWND']):
         if idx +1 == lines_cnt:
             break
-        plt.plot(sublist, label=f'List {idx+1}')  # 对每个子列表绘制折线图
+        if sublist is None:
+            continue
+        t = times[idx] if times else list(range(len(sublist)))
+        plt.plot(*downsample(t, sublist), label=f'List {idx+1}')  # 对每个子列表绘制折线图
         # print(len(sublist), sublist[0])
 
     # 添加图表标题和图例
     plt.title('Line Plot for Nested List')
-    plt.xlabel('Index')
+    plt.xlabel('Time (s)' if times else 'Index')
     plt.ylabel('Values')
     plt.legend()
     plt.grid(True)
@@ -60,7 +79,7 @@ def calculate_stats(cc_alg='cubic', level='low', confidence=0.95):
     stats_names = ['Mean', 'Variance', 'HCI']
     results = []
     for m in metrics:
-        one_metric_data = [data[cc_alg][level][m][r] for r in range(5)]
+        _, one_metric_data = completed_runs(data[cc_alg][level][m][:5])
         mean = np.mean(one_metric_data)
         variance = np.var(one_metric_data, ddof=1)
         n = len(one_metric_data)
@@ -79,12 +98,12 @@ def calculate_stats(cc_alg='cubic', level='low', confidence=0.95):
 
 
 def draw_5runs_2algs_lines(metric='Throughput', level='low'):
-    reno_data = [data['reno'][level][metric][r] for r in range(5)]
-    cubic_data = [data['cubic'][level][metric][r] for r in range(5)]
+    reno_x, reno_data = completed_runs(data['reno'][level][metric][:5])
+    cubic_x, cubic_data = completed_runs(data['cubic'][level][metric][:5])
     x = [1, 2, 3, 4, 5]
 
-    plt.plot(x, np.log(reno_data), label="Reno", color=colors[2], marker="o", linestyle=":", lw=2)
-    plt.plot(x, np.log(cubic_data), label="Cubic", color=colors[1], marker="s", linestyle="--", lw=2)
+    plt.plot(reno_x, np.log(reno_data), label="Reno", color=colors[2], marker="o", linestyle=":", lw=2)
+    plt.plot(cubic_x, np.log(cubic_data), label="Cubic", color=colors[1], marker="s", linestyle="--", lw=2)
     plt.xticks(ticks=x)
 
     plt.xlabel("Run", fontsize=12)
@@ -94,30 +113,34 @@ def draw_5runs_2algs_lines(metric='Throughput', level='low'):
     plt.grid(alpha=0.3)
     plt.savefig(f'./results/{level}_{metric}.png', bbox_inches='tight')
 
+def log_runs(values):
+    runs, values = completed_runs(values)
+    return runs, np.log(values)
+
 def draw_5runs_2alg_lines_all(metric='Throughput'):
     x = [1, 2, 3, 4, 5]
 
     fig, axes = plt.subplots(1, 3, figsize=(16, 5), sharey=True)
 
     # 绘制第一个子图
-    axes[0].plot(x, np.log([data['reno']['low'][metric][r] for r in range(5)]), label="Reno", color=colors[2], marker="o", linestyle=":", lw=2)
-    axes[0].plot(x, np.log([data['cubic']['low'][metric][r] for r in range(5)]), label="Cubic", color=colors[1], marker="s", linestyle="--", lw=2)
+    axes[0].plot(*log_runs(data['reno']['low'][metric][:5]), label="Reno", color=colors[2], marker="o", linestyle=":", lw=2)
+    axes[0].plot(*log_runs(data['cubic']['low'][metric][:5]), label="Cubic", color=colors[1], marker="s", linestyle="--", lw=2)
     axes[0].set_title("Low Bandwidth Level")
     axes[0].legend(loc="lower left", fontsize=14)
     axes[0].set_xlabel("Run", fontsize=12)
     axes[0].set_xticks(ticks=x)
 
     # 绘制第二个子图
-    axes[1].plot(x, np.log([data['reno']['med'][metric][r] for r in range(5)]), label="Reno", color=colors[2], marker="o", linestyle=":", lw=2)
-    axes[1].plot(x, np.log([data['cubic']['med'][metric][r] for r in range(5)]), label="Cubic", color=colors[1], marker="s", linestyle="--", lw=2)
+    axes[1].plot(*log_runs(data['reno']['med'][metric][:5]), label="Reno", color=colors[2], marker="o", linestyle=":", lw=2)
+    axes[1].plot(*log_runs(data['cubic']['med'][metric][:5]), label="Cubic", color=colors[1], marker="s", linestyle="--", lw=2)
     axes[1].set_title("Medium Bandwidth Level")
     axes[1].legend(loc="lower left", fontsize=14)
     axes[1].set_xlabel("Run", fontsize=12)
     axes[1].set_xticks(ticks=x)
 
     # 绘制第三个子图
-    axes[2].plot(x, np.log([data['reno']['high'][metric][r] for r in range(5)]), label="Reno", color=colors[2], marker="o", linestyle=":", lw=2)
-    axes[2].plot(x, np.log([data['cubic']['high'][metric][r] for r in range(5)]), label="Cubic", color=colors[1], marker="s", linestyle="--", lw=2)
+    axes[2].plot(*log_runs(data['reno']['high'][metric][:5]), label="Reno", color=colors[2], marker="o", linestyle=":", lw=2)
+    axes[2].plot(*log_runs(data['cubic']['high'][metric][:5]), label="Cubic", color=colors[1], marker="s", linestyle="--", lw=2)
     axes[2].set_title("High Bandwidth Level")
     axes[2].legend(loc="lower left", fontsize=14)
     axes[2].set_xlabel("Run", fontsize=12)
@@ -139,8 +162,8 @@ def draw_5runs_2alg_lines_all(metric='Throughput'):
 def CRN_comparison(metric='Throughput', confidence=.90):
     for level in levels:
         print(f'\nLevel: {level}')
-        reno_data = np.array(data['reno'][level][metric])
-        cubic_data = np.array(data['cubic'][level][metric])
+        # Pair by run index and drop a run unless both algorithms have it
+        reno_data, cubic_data = paired_runs(level, metric)
 
         diffs = reno_data - cubic_data
         # print(f'diffs: {diffs}')
@@ -161,7 +184,26 @@ def CRN_comparison(metric='Throughput', confidence=.90):
         ci_upper = mean_diff + hci
         print(f'CI ({confidence}): {ci_lower:.2f}, {ci_upper:.2f}')
 
+def render_all(out_dir='./results', lines_cnt=5, processes=None):
+    """Render every cwnd and per-metric figure of the results set in parallel, reusing cached ones."""
+    jobs = []
+    for cc_alg in ['reno', 'cubic']:
+        for level in levels:
+            cwnds = data[cc_alg][level]['CWND'][:lines_cnt]
+            times = data[cc_alg][level].get('CWND Time', [None] * len(cwnds))
+            series = [{'label': f'Run {i+1}', 'time': times[i], 'cwnd': cwnd} for i, cwnd in enumerate(cwnds)
+                      if cwnd is not None]
+            jobs.append(('cwnd', {'out_path': f'{out_dir}/{cc_alg}_{level}_{lines_cnt}.png',
+                                  'series': series, 'title': f'{cc_alg} ({level})'}))
+    for metric in metrics:
+        per_level = {level: {cc_alg: data[cc_alg][level][metric] for cc_alg in ['reno', 'cubic']} for level in levels}
+        jobs.append(('runs', {'out_path': f'{out_dir}/all_levels_{metric}.pdf', 'metric': metric,
+                              'per_level': per_level}))
+    return render_figures(jobs, processes)
+
+
 if __name__ == '__main__':
     # draw_5runs_2algs_lines(level='high')
-    draw_5runs_2alg_lines_all()
+    # draw_5runs_2alg_lines_all()
     # CRN_comparison()
+    render_all()
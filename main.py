@@ -1,6 +1,15 @@
+import argparse
+import subprocess
 from src.helpers import *
 from src.sender import Sender
 from src.strategies import *
+from src.workload import *
+from src.settings import EXP_SETTINGS
+from src.replication import SequentialStopper, seed_for_run
+from src.steady_state import SteadyStateDetector
+from src.capture import CaptureLog
+from src.distributed import Coordinator, work, start_local_worker
+from src.worker import STOP_TIMEOUT
 from collections import defaultdict
 from datetime import datetime
 
@@ -11,39 +20,35 @@ from datetime import datetime
 
 
 RUN_TIMES = 5
-DURATION_PER_RUN = 60 # seconds
-LAMBDAS = {
-    'low': 2 * 10 * 1e6 / 12000.0,
-    'med': 2 * 30 * 1e6 / 12000.0,
-    'high': 2 * 100 * 1e6 / 12000.0,
-}
-EXP_SETTINGS = {
-    'low': {
-        'mahimahi': {
-            'delay': 88,
-            'queue_size': 26400,
-            'trace_file': 'low_10mbps.trace'
-        },
-        'lambda': LAMBDAS['low']
-    },
-    'med': {
-        'mahimahi': {
-            'delay': 88,
-            'queue_size': 26400,
-            'trace_file': 'med_30mbps.trace'
-        },
-        'lambda': LAMBDAS['med']
-    },
-    'high': {
-        'mahimahi': {
-            'delay': 88,
-            'queue_size': 26400,
-            'trace_file': 'high_100mbps.trace'
-        },
-        'lambda': LAMBDAS['high']
-    }
+DURATION_PER_RUN = 60 # seconds, only a cap when EARLY_STOP is set
+EARLY_STOP = False  # end each run once its steady-state estimate is stable
+STEADY_STATE = {
+    'interval': 0.5,  # seconds per sample of the rate/RTT/cwnd streams
+    'rel_precision': 0.05,
+    'min_steady_time': 10.0,
 }
 SEEDS = [2518, 3889, 5294, 540, 3205]
+QUEUES = ['droptail']  # bottleneck queue disciplines to cross with EXP_SETTINGS, see QUEUE_DISCIPLINES
+ECN_THRESHOLD = None  # ms of queueing delay; if set, every setting also runs with ECN marking (and DCTCP joins)
+REUSE_RECEIVER = True  # keep one receiver worker per mahimahi setting instead of one per run
+CAPTURE_DIR = None  # if set, log every packet event of each run there for offline replay
+KERNEL_TCP = False  # run Linux's own reno/cubic per socket instead of the Python strategies
+HYSTART = False  # leave slow start with HyStart++ instead of at the fixed slow_start_thresh
+ALGORITHMS = ['reno', 'cubic']  # also 'bbr'
+RECEIVER_SHARDS = 1  # receiver processes sharing the port, see ShardedReceiver
+WORKLOADS = {
+    'websearch': WEB_SEARCH_CDF,
+    'datamining': DATA_MINING_CDF,
+}
+WORKLOAD_LOAD = 0.5  # offered load as a fraction of bottleneck capacity
+LEASE_TIMEOUT = 3 * DURATION_PER_RUN + 60  # s a distributed worker may hold one cell
+ADAPTIVE = {
+    'metric': 'Throughput',
+    'rel_precision': 0.05,  # target CI half-width relative to the mean
+    'confidence': 0.95,
+    'min_runs': 3,
+    'max_runs': 20,
+}
 
 
 # def one_run(setting):
@@ -88,18 +93,126 @@ SEEDS = [2518, 3889, 5294, 540, 3205]
 #     return exp_results, file_name
 
 
-def one_run(setting, cc_alg='cubic', seed=None):
-    port = get_open_udp_port()
+def run_options():
+    """Per-run options set from the command line; distributed cells carry them to the workers."""
+    return {'early_stop': EARLY_STOP, 'kernel': KERNEL_TCP, 'hystart': HYSTART,
+            'capture_dir': CAPTURE_DIR, 'shards': RECEIVER_SHARDS}
+
+
+def make_strategy(setting, cc_alg='cubic', seed=None, hystart=None):
+    if hystart is None:
+        hystart = HYSTART
+    # HyStart++ decides when slow start ends, so it starts without a threshold
+    ssthresh = float('inf') if hystart else 10
+    if cc_alg == 'bbr':
+        return BbrStrategy(initial_cwnd=10, rate_lambda=setting['lambda'], seed=seed)
+    if cc_alg == 'dctcp':
+        return DctcpStrategy(slow_start_thresh=ssthresh, initial_cwnd=1, rate_lambda=setting['lambda'], seed=seed, hystart=hystart)
     if cc_alg == 'cubic':
-        res = run_with_mahimahi(setting['mahimahi'], DURATION_PER_RUN, [Sender(port, CubicStrategy(slow_start_thresh=10, initial_cwnd=1, rate_lambda=setting['lambda'], seed=seed))], print_flag=False)
+        return CubicStrategy(slow_start_thresh=ssthresh, initial_cwnd=1, rate_lambda=setting['lambda'], seed=seed, hystart=hystart)
     else:
-        res = run_with_mahimahi(setting['mahimahi'], DURATION_PER_RUN, [Sender(port, RenoStrategy(slow_start_thresh=10, initial_cwnd=1, rate_lambda=setting['lambda'], seed=seed))], print_flag=False)
+        return RenoStrategy(slow_start_thresh=ssthresh, initial_cwnd=1, rate_lambda=setting['lambda'], seed=seed, hystart=hystart)
+
+
+WORKERS = {}
+
+
+def get_worker(mahimahi_settings, shards=1):
+    key = json.dumps([mahimahi_settings, shards], sort_keys=True)
+    if key not in WORKERS:
+        WORKERS[key] = start_receiver_worker(mahimahi_settings, shards)
+    return WORKERS[key]
+
+
+def shutdown_workers():
+    for worker in WORKERS.values():
+        worker.close()
+    WORKERS.clear()
+
+
+def run_senders(setting, senders, receiver_capture=None, shards=1):
+    if shards > len(senders):
+        # Steering is by sender port: shards beyond the number of senders would never see a datagram
+        raise ValueError(f"--shards {shards} needs at least {shards} senders per run, got {len(senders)}")
+    ecn_threshold = setting.get('ecn_threshold')
+    if REUSE_RECEIVER:
+        return run_with_worker(get_worker(setting['mahimahi'], shards), DURATION_PER_RUN, senders, print_flag=False,
+                               receiver_capture=receiver_capture, ecn_threshold=ecn_threshold)
+    return run_with_mahimahi(setting['mahimahi'], DURATION_PER_RUN, senders, print_flag=False,
+                             receiver_capture=receiver_capture, ecn_threshold=ecn_threshold, shards=shards)
+
+
+def kernel_run(setting, cc_alg='cubic'):
+    port = get_open_udp_port()
+    res = run_kernel_tcp_with_mahimahi(setting['mahimahi'], DURATION_PER_RUN, [KernelTcpSender(port, cc_alg)], print_flag=False)
+    return res
+
+
+def one_run(setting, cc_alg='cubic', seed=None, options=None):
+    options = options or run_options()
+    if options['kernel']:
+        return kernel_run(setting, cc_alg)
+
+    port = get_open_udp_port()
+    steady_state = SteadyStateDetector(**STEADY_STATE) if options['early_stop'] else None
+    capture, receiver_capture = None, None
+    capture_dir = options['capture_dir']
+    if capture_dir:
+        os.makedirs(capture_dir, exist_ok=True)
+        capture = CaptureLog(f"{capture_dir}/{cc_alg}_{seed}_{port}_sender.cap")
+        receiver_capture = f"{capture_dir}/{cc_alg}_{seed}_{port}_receiver.cap"
+    strategy = make_strategy(setting, cc_alg, seed, options['hystart'])
+    res = run_senders(setting, [Sender(port, strategy, steady_state, capture)], receiver_capture, options['shards'])
+    if res is not None:
+        # Link capacity in MTU-sized packets per second is half of the target lambda
+        ack_times = [t for t, _ in strategy.times_of_acknowledgements]
+        res['Time to Full Utilization'] = time_to_utilization(ack_times, setting['lambda'] / 2)
+    if res is not None and capture:
+        res['Capture'] = [capture.path, receiver_capture]
     return res
 
 
-def main():
+def workload_run(setting, cc_alg='cubic', workload='websearch', seed=None, options=None):
+    options = options or run_options()
+    # Link capacity in MTU-sized packets per second is half of the target lambda
+    size_dist = FlowSizeDistribution(WORKLOADS[workload])
+    arrival_rate = arrival_rate_for_load(WORKLOAD_LOAD, setting['lambda'] / 2, size_dist)
+    strategy = FlowWorkloadStrategy(lambda flow_seed: make_strategy(setting, cc_alg, flow_seed, options['hystart']),
+                                    size_dist, arrival_rate, seed=seed)
+
+    port = get_open_udp_port()
+    res = run_senders(setting, [Sender(port, strategy)], shards=options['shards'])
+    if res is not None:
+        res['FCT'] = strategy.flow_completion_stats()
+    return res
+
+
+def experiment_settings():
+    """
+    EXP_SETTINGS crossed with QUEUES, and with ECN marking if ECN_THRESHOLD is
+    set; droptail without ECN keeps the plain setting name (the loss-only baseline).
+    """
+    settings = {}
+    for queue in QUEUES:
+        for name, setting in EXP_SETTINGS.items():
+            if queue != 'droptail':
+                name = f'{name}-{queue}'
+                setting = dict(setting, mahimahi=dict(setting['mahimahi'], queue=queue))
+            settings[name] = setting
+            if ECN_THRESHOLD is not None:
+                settings[f'{name}-ecn'] = dict(setting, ecn_threshold=ECN_THRESHOLD)
+    return settings
+
+
+def algorithms():
+    if ECN_THRESHOLD is not None and 'dctcp' not in ALGORITHMS:
+        return tuple(ALGORITHMS) + ('dctcp',)
+    return tuple(ALGORITHMS)
+
+
+def main(workload=None):
     # Get all available CC algorithms
-    options = 'reno', 'cubic'
+    options = algorithms()
 
     exp_results = {}
     for cc_alg in options:
@@ -108,15 +221,116 @@ def main():
 
         # run each setting multiple times
         exp_results[cc_alg] = defaultdict(dict)
-        for setting in EXP_SETTINGS:
+        settings = experiment_settings()
+        for setting in settings:
             multi_run_results = []
             for i in range(RUN_TIMES):
                 print(f"\n==> Setting: {setting}; Run ({i+1}/{RUN_TIMES})")
-                res = one_run(EXP_SETTINGS[setting], cc_alg, seed=SEEDS[i%5])
+                if workload:
+                    res = workload_run(settings[setting], cc_alg, workload, seed=SEEDS[i%5])
+                else:
+                    res = one_run(settings[setting], cc_alg, seed=SEEDS[i%5])
                 multi_run_results.append(res)
             exp_results[cc_alg][setting] = {
                 key: [d[key] if key != "CWND" else d[key] for d in multi_run_results] for key in multi_run_results[0]}
-    
+
+    file_name = save_results(exp_results)
+    return exp_results, file_name
+
+
+def main_adaptive(workload=None):
+    """
+    Replicate each setting until the CIs of both algorithms and of their paired
+    (CRN) difference reach ADAPTIVE['rel_precision'], or ADAPTIVE['max_runs'].
+    """
+    options = algorithms()
+
+    exp_results = {cc_alg: defaultdict(dict) for cc_alg in options}
+    exp_results['replications'] = {}
+    settings = experiment_settings()
+    for setting in settings:
+        stopper = SequentialStopper(options, **ADAPTIVE)
+        multi_run_results = {cc_alg: [] for cc_alg in options}
+        i = 0
+        while not stopper.done():
+            seed = seed_for_run(i, SEEDS)
+            pair = {}
+            for cc_alg in options:
+                print(f"\n==> Setting: {setting}; Algorithm: {cc_alg}; Run {i+1} (seed {seed})")
+                if workload:
+                    pair[cc_alg] = workload_run(settings[setting], cc_alg, workload, seed=seed)
+                else:
+                    pair[cc_alg] = one_run(settings[setting], cc_alg, seed=seed)
+            # Keep replications paired so the CRN difference stays valid
+            if all(res is not None for res in pair.values()):
+                for cc_alg, res in pair.items():
+                    multi_run_results[cc_alg].append(res)
+                    stopper.add(cc_alg, res)
+            i += 1
+            print(f"==> Relative precision after {i} runs: {stopper.precisions()}")
+            if i >= 2 * ADAPTIVE['max_runs']:
+                break  # every run failed, give up on this setting
+
+        for cc_alg in options:
+            runs = multi_run_results[cc_alg]
+            if runs:
+                exp_results[cc_alg][setting] = {key: [d[key] for d in runs] for key in runs[0]}
+        exp_results['replications'][setting] = stopper.summary()
+
+    file_name = save_results(exp_results)
+    return exp_results, file_name
+
+
+def experiment_cells(workload=None):
+    """The grid of main() as independent cells (one replication each) for distributed runs."""
+    settings = experiment_settings()
+    return [{'id': f'{cc_alg}/{name}/{i}', 'cc_alg': cc_alg, 'name': name, 'setting': settings[name], 'run': i,
+             'seed': SEEDS[i % 5], 'workload': workload, 'options': run_options()}
+            for cc_alg in algorithms() for name in settings for i in range(RUN_TIMES)]
+
+
+def run_cell(cell):
+    """Run one leased cell on a worker, with the options the coordinator was started with."""
+    print(f"\n==> Cell: {cell['id']}")
+    if cell['workload']:
+        return workload_run(cell['setting'], cell['cc_alg'], cell['workload'], seed=cell['seed'], options=cell['options'])
+    return one_run(cell['setting'], cell['cc_alg'], seed=cell['seed'], options=cell['options'])
+
+
+def main_distributed(address, workload=None, local_workers=0):
+    """
+    Same grid as main(), leased cell by cell to `main.py --worker` processes
+    on this or other hosts, plus local_workers processes started here.
+    """
+    cells = experiment_cells(workload)
+    coordinator = Coordinator(cells, address, lease_timeout=LEASE_TIMEOUT)
+    processes = [start_local_worker(coordinator.address, __file__, []) for _ in range(local_workers)]
+    try:
+        results = coordinator.run()
+    finally:
+        for process in processes:
+            try:
+                process.wait(STOP_TIMEOUT)
+            except subprocess.TimeoutExpired:
+                stop_process_group(process)
+
+    # Index runs by their replication, with None for failed cells, so run i of
+    # every algorithm stays at index i (same seed, for the CRN pairing)
+    by_run = defaultdict(lambda: [None] * RUN_TIMES)
+    for cell in cells:
+        by_run[cell['cc_alg'], cell['name']][cell['run']] = results.get(cell['id'])
+
+    exp_results = {cc_alg: defaultdict(dict) for cc_alg in algorithms()}
+    for (cc_alg, name), runs in by_run.items():
+        keys = {key: None for res in runs if res is not None for key in res}
+        if keys:
+            exp_results[cc_alg][name] = {key: [res.get(key) if res is not None else None for res in runs] for key in keys}
+
+    file_name = save_results(exp_results)
+    return exp_results, file_name
+
+
+def save_results(exp_results):
     current_date = datetime.now().strftime("%m-%d_%H-%M")
     output_dir = '/app/results'  # Directories mounted in the container
     file_name = f"{output_dir}/output_{current_date}.json"
@@ -125,9 +339,70 @@ def main():
     with open(file_name, 'w') as json_file:
         json.dump(exp_results, json_file, indent=4)
     print(f"\nExperiment is done. Results are saved to {file_name}")
-
-    return exp_results, file_name
+    return file_name
 
 
 if __name__ == "__main__":
-    _, file_name = main()
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workload', choices=list(WORKLOADS),
+                        help='run Poisson flow arrivals with this size distribution instead of one long flow')
+    parser.add_argument('--adaptive', action='store_true',
+                        help='replicate each setting until the confidence intervals converge')
+    parser.add_argument('--early-stop', action='store_true',
+                        help='measure steady state only and end runs once it is stable')
+    parser.add_argument('--kernel', action='store_true',
+                        help="bulk TCP with the kernel's reno/cubic selected per socket, sampled via TCP_INFO")
+    parser.add_argument('--capture-dir', help='write packet event capture logs of every run to this directory')
+    parser.add_argument('--queues', nargs='+', choices=list(QUEUE_DISCIPLINES), default=QUEUES,
+                        help='bottleneck queue disciplines to run every setting with')
+    parser.add_argument('--ecn-threshold', type=float,
+                        help='also run every setting with CE marks above this queueing delay (ms), and DCTCP')
+    parser.add_argument('--algorithms', nargs='+', choices=['reno', 'cubic', 'bbr', 'dctcp'], default=ALGORITHMS,
+                        help='strategies to compare (with --kernel, the kernel modules of the same name)')
+    parser.add_argument('--hystart', action='store_true',
+                        help='leave slow start with HyStart++ (RFC 9406) instead of at slow_start_thresh=10')
+    parser.add_argument('--coordinator', metavar='ADDR',
+                        help='lease the runs to workers on host:port or unix:/path instead of running them here')
+    parser.add_argument('--local-workers', type=int, default=0,
+                        help='with --coordinator, also start this many worker processes on this host')
+    parser.add_argument('--worker', metavar='ADDR', help='run cells leased by the coordinator at host:port or unix:/path')
+    parser.add_argument('--shards', type=int, default=RECEIVER_SHARDS,
+                        help='receiver processes sharing the port via SO_REUSEPORT; whole senders are steered '
+                             'by source port, so it needs as many senders per run')
+    args = parser.parse_args()
+    QUEUES = args.queues
+    ECN_THRESHOLD = args.ecn_threshold
+    EARLY_STOP = args.early_stop
+    CAPTURE_DIR = args.capture_dir
+    KERNEL_TCP = args.kernel
+    HYSTART = args.hystart
+    ALGORITHMS = args.algorithms
+    RECEIVER_SHARDS = args.shards
+    if RECEIVER_SHARDS > 1 and CAPTURE_DIR:
+        raise ValueError("--capture-dir logs from a single receiver process and cannot be used with --shards")
+    if RECEIVER_SHARDS > 1:
+        # one_run and workload_run drive one Sender (workload flows share its port), so all
+        # traffic would land in one shard while the others sit idle
+        raise ValueError("--shards spreads several senders over receiver processes, but every run here has one sender")
+    if KERNEL_TCP:
+        if ECN_THRESHOLD is not None:
+            raise ValueError("--ecn-threshold marks in the Python receiver and cannot be used with --kernel")
+        if RECEIVER_SHARDS > 1:
+            raise ValueError("--shards splits the Python receiver and cannot be used with --kernel")
+        missing = [alg for alg in algorithms() if alg not in check_available_ccalgs()]
+        if missing:
+            raise ValueError(f"Kernel does not provide {missing}")
+
+    try:
+        if args.worker:
+            work(args.worker, run_cell)
+        elif args.coordinator:
+            if args.adaptive:
+                raise ValueError("--adaptive decides the next run from the previous ones and cannot be distributed")
+            _, file_name = main_distributed(args.coordinator, workload=args.workload, local_workers=args.local_workers)
+        elif args.adaptive:
+            _, file_name = main_adaptive(workload=args.workload)
+        else:
+            _, file_name = main(workload=args.workload)
+    finally:
+        shutdown_workers()
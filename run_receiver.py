@@ -1,17 +1,49 @@
 #!/usr/bin/env python
 
+import os
+import sys
+import signal
 import argparse
 from src.receiver import Receiver
+from src.worker import serve
+from src.sharded import ShardedReceiver
+from src.capture import CaptureLog
+from src.kernel_tcp import KernelTcpReceiver
 
 
 def main() -> None:
     parser = argparse.ArgumentParser()
     parser.add_argument('ip_port_pairs', nargs='*')
+    parser.add_argument('--serve', nargs=2, metavar=('CONTROL_IP', 'CONTROL_PORT'),
+                        help='run as a persistent worker driven over a control channel')
+    parser.add_argument('--capture', help='log received segments and sent ACKs to this file')
+    parser.add_argument('--tcp', action='store_true', help='connect to kernel TCP senders instead of the UDP protocol')
+    parser.add_argument('--ecn-threshold', type=float,
+                        help='mark segments queued longer than this (ms) as CE and echo the marks in ACKs')
+    parser.add_argument('--shards', type=int, default=1,
+                        help='serve the senders from this many processes sharing the port (SO_REUSEPORT); '
+                             'each sender stays in one process, so this only helps with several senders')
+    parser.add_argument('--drops-file', help='on exit, write the number of datagrams dropped on the socket here')
     args = parser.parse_args()
     peers = args.ip_port_pairs
 
-    receiver = Receiver([(peers[i], int(peers[i+1])) for i in range(0, len(peers), 2)])
+    if args.serve:
+        serve(args.serve[0], int(args.serve[1]), args.shards)
+        return
 
+    peers = [(peers[i], int(peers[i+1])) for i in range(0, len(peers), 2)]
+    if args.tcp:
+        receiver = KernelTcpReceiver(peers)
+    elif args.shards > 1:
+        if args.capture:
+            parser.error('--capture needs a single shard')
+        receiver = ShardedReceiver(peers, args.shards, ecn_threshold=args.ecn_threshold)
+    else:
+        capture = CaptureLog(args.capture) if args.capture else None
+        receiver = Receiver(peers, capture=capture, ecn_threshold=args.ecn_threshold)
+
+    # Being stopped by process group is the normal end of a run: still report the drops
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
     try:
         receiver.perform_handshakes()
         receiver.run()
@@ -19,6 +51,13 @@ def main() -> None:
         pass
     finally:
         receiver.cleanup()
+        if not args.tcp:
+            drops = receiver.socket_drops()
+            print(f"[receiver] Datagrams dropped on the socket: {drops}")
+            if args.drops_file:
+                with open(args.drops_file + '.tmp', 'w') as f:
+                    f.write(f'{drops}\n')
+                os.replace(args.drops_file + '.tmp', args.drops_file)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,95 @@
+import mmap
+import time
+import struct
+from typing import Iterator, List, Optional, Tuple
+
+# Event kinds
+SEND = 1
+ACK = 2         # value: RTT sample (s)
+DUP_ACK = 3     # value: strategy.num_duplicate_acks after this ACK
+RETRANSMIT = 4
+CWND = 5        # value: new cwnd
+RECV = 6        # receiver: data segment arrived
+ACK_SENT = 7    # receiver: ACK sent for seq
+RUN = 8         # sender: run started, value: seconds_to_run
+
+EVENT_NAMES = {
+    SEND: 'send', ACK: 'ack', DUP_ACK: 'dup-ack', RETRANSMIT: 'retransmit',
+    CWND: 'cwnd', RECV: 'recv', ACK_SENT: 'ack-sent', RUN: 'run',
+}
+
+# Flags
+FLAG_SEQUENTIAL = 0x1  # ACK counted as sequential by the strategy
+
+MAGIC = b'CCAP'
+HEADER = struct.Struct('<4sHHQ')  # magic, version, record size, record count
+RECORD = struct.Struct('<QBBHqd')  # ts_ns, kind, flags, port, seq, value
+VERSION = 1
+
+
+class CaptureLog(object):
+    """
+    Append-only log of fixed-size binary event records in a preallocated,
+    memory-mapped file. Records are packed into a small staging buffer and
+    copied into the mapping in bulk every `flush_every` records.
+    """
+    def __init__(self, path: str, capacity=1 << 20, flush_every=4096) -> None:
+        self.path = path
+        self.capacity = capacity
+        self.flush_every = flush_every
+        self.count = 0
+        self.pending = 0
+        self.buffer = bytearray(flush_every * RECORD.size)
+
+        self.file = open(path, 'w+b')
+        self.file.truncate(HEADER.size + capacity * RECORD.size)
+        self.mm = mmap.mmap(self.file.fileno(), 0)
+        HEADER.pack_into(self.mm, 0, MAGIC, VERSION, RECORD.size, 0)
+
+    def append(self, kind: int, seq: int, value=0.0, port=0, flags=0, ts_ns: Optional[int] = None) -> None:
+        RECORD.pack_into(self.buffer, self.pending * RECORD.size,
+                         ts_ns if ts_ns is not None else time.time_ns(), kind, flags, port & 0xffff, seq, value)
+        self.pending += 1
+        if self.pending == self.flush_every:
+            self.flush()
+
+    def flush(self) -> None:
+        if self.pending == 0:
+            return
+        if self.count + self.pending > self.capacity:
+            while self.count + self.pending > self.capacity:
+                self.capacity *= 2
+            self.mm.resize(HEADER.size + self.capacity * RECORD.size)
+        start = HEADER.size + self.count * RECORD.size
+        size = self.pending * RECORD.size
+        self.mm[start:start + size] = self.buffer[:size]
+        self.count += self.pending
+        self.pending = 0
+        HEADER.pack_into(self.mm, 0, MAGIC, VERSION, RECORD.size, self.count)
+
+    def close(self) -> None:
+        if self.mm.closed:
+            return
+        self.flush()
+        self.mm.flush()
+        self.mm.close()
+        # Drop the unused preallocated tail
+        self.file.truncate(HEADER.size + self.count * RECORD.size)
+        self.file.close()
+
+
+class CaptureReader(object):
+    def __init__(self, path: str) -> None:
+        with open(path, 'rb') as f:
+            self.data = f.read()
+        magic, version, record_size, self.count = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC or record_size != RECORD.size:
+            raise ValueError(f"{path} is not a capture log (version {VERSION})")
+
+    def records(self) -> Iterator[Tuple[int, int, int, int, int, float]]:
+        """Yields (ts_ns, kind, flags, port, seq, value) in capture order."""
+        end = HEADER.size + self.count * RECORD.size
+        return RECORD.iter_unpack(memoryview(self.data)[HEADER.size:end])
+
+    def events(self, *kinds: int) -> List[Tuple[int, int, int, int, int, float]]:
+        return [r for r in self.records() if r[1] in kinds]
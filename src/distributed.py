@@ -0,0 +1,221 @@
+import os
+import sys
+import time
+import socket
+import select
+import subprocess
+from collections import deque
+from typing import Callable, Dict, List, Optional
+from src.worker import ControlChannel
+
+LEASE_TIMEOUT = 600  # s before a leased cell is handed to another worker
+MAX_ATTEMPTS = 3  # distinct workers that may fail a cell before it is recorded as failed
+QUARANTINE_AFTER = 3  # failures in a row before a worker gets no more leases
+CONNECT_RETRIES = 30
+
+
+def parse_address(address: str):
+    """'unix:/path/to.sock' or 'host:port' to (family, sockaddr)."""
+    if address.startswith('unix:'):
+        return socket.AF_UNIX, address[len('unix:'):]
+    host, port = address.rsplit(':', 1)
+    return socket.AF_INET, (host or '0.0.0.0', int(port))
+
+
+def connect(address: str, retries=CONNECT_RETRIES) -> socket.socket:
+    family, sockaddr = parse_address(address)
+    for attempt in range(retries + 1):
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        try:
+            sock.connect(sockaddr)
+            return sock
+        except (ConnectionRefusedError, FileNotFoundError):
+            sock.close()
+            if attempt == retries:
+                raise
+            time.sleep(1)
+
+
+class Coordinator(object):
+    """
+    Holds a grid of experiment cells and leases them one at a time to workers
+    that connect over TCP or a Unix socket. A lease is given back to the queue
+    when its worker disconnects, reports a failure or exceeds lease_timeout;
+    the first result that arrives for a cell wins. A cell is never leased again
+    to a worker that already failed it, and a worker that keeps failing is
+    quarantined, so one broken worker cannot use up every cell's attempts.
+    """
+    def __init__(self, cells: List[Dict], address: str, lease_timeout=LEASE_TIMEOUT, max_attempts=MAX_ATTEMPTS) -> None:
+        self.cells = {cell['id']: cell for cell in cells}
+        self.lease_timeout = lease_timeout
+        self.max_attempts = max_attempts
+
+        self.pending = deque(self.cells)
+        self.failed_on: Dict[str, set] = {cell_id: set() for cell_id in self.cells}  # workers that failed a cell
+        self.failures: Dict[ControlChannel, int] = {}  # failures in a row per worker
+        self.quarantined = set()
+        self.results: Dict[str, Optional[Dict]] = {}
+        self.leases: Dict[int, tuple] = {}  # lease id -> (cell id, channel, deadline)
+        self.idle: List[ControlChannel] = []
+        self.channels: List[ControlChannel] = []
+        self.next_lease = 0
+
+        family, sockaddr = parse_address(address)
+        if family == socket.AF_UNIX and os.path.exists(sockaddr):
+            os.remove(sockaddr)
+        self.listener = socket.socket(family, socket.SOCK_STREAM)
+        if family == socket.AF_INET:
+            self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listener.bind(sockaddr)
+        self.listener.listen(64)
+        if family == socket.AF_UNIX:
+            self.address = f'unix:{sockaddr}'
+        else:
+            host, port = self.listener.getsockname()[:2]
+            self.address = f"{'127.0.0.1' if host == '0.0.0.0' else host}:{port}"
+
+    def run(self) -> Dict[str, Optional[Dict]]:
+        """Serve leases until every cell has a result (None for cells that kept failing)."""
+        print(f"[coordinator] Serving {len(self.cells)} cells on {self.address}")
+        while len(self.results) < len(self.cells):
+            self.expire_leases()
+            self.dispatch()
+            self.give_up_stalled()
+            readable, _, _ = select.select([self.listener] + self.channels, [], [], 1.0)
+            for r in readable:
+                if r is self.listener:
+                    conn, _ = self.listener.accept()
+                    self.channels.append(ControlChannel(conn))
+                    continue
+                try:
+                    msg = r.recv()
+                except (OSError, ValueError):
+                    msg = None
+                if msg is None:
+                    self.drop(r)
+                else:
+                    self.handle(r, msg)
+
+        for channel in self.channels:
+            try:
+                channel.send({'cmd': 'exit'})
+            except OSError:
+                pass
+            channel.close()
+        self.listener.close()
+        return self.results
+
+    def handle(self, channel: ControlChannel, msg: Dict) -> None:
+        if msg.get('host'):
+            print(f"[coordinator] Worker joined from {msg['host']}")
+        lease = self.leases.pop(msg.get('lease'), None)
+        cell_id = lease[0] if lease else msg.get('cell')
+        if cell_id is not None and cell_id not in self.results:
+            if msg.get('result') is not None:
+                self.results[cell_id] = msg['result']
+                self.failures[channel] = 0
+                print(f"[coordinator] {cell_id} done ({len(self.results)}/{len(self.cells)})")
+            elif lease:
+                print(f"[coordinator] {cell_id} failed: {msg.get('error', 'no result')}")
+                self.retry(cell_id, channel)
+        self.idle.append(channel)
+
+    def drop(self, channel: ControlChannel) -> None:
+        """Worker went away; whatever it held goes back to the queue."""
+        for lease_id, (cell_id, owner, _) in list(self.leases.items()):
+            if owner is channel:
+                del self.leases[lease_id]
+                print(f"[coordinator] Lost worker holding {cell_id}")
+                self.retry(cell_id, channel)
+        self.channels.remove(channel)
+        if channel in self.idle:
+            self.idle.remove(channel)
+        self.quarantined.discard(channel)
+        self.failures.pop(channel, None)
+        channel.close()
+
+    def expire_leases(self) -> None:
+        now = time.time()
+        for lease_id, (cell_id, owner, deadline) in list(self.leases.items()):
+            if now > deadline:
+                del self.leases[lease_id]
+                print(f"[coordinator] Lease on {cell_id} expired")
+                self.retry(cell_id, owner)
+
+    def retry(self, cell_id: str, channel: ControlChannel) -> None:
+        """Count the failure against the worker and put the cell at the back of the queue."""
+        self.failures[channel] = self.failures.get(channel, 0) + 1
+        if self.failures[channel] >= QUARANTINE_AFTER and channel not in self.quarantined:
+            print(f"[coordinator] Quarantining a worker after {self.failures[channel]} failures in a row")
+            self.quarantined.add(channel)
+        if cell_id in self.results:
+            return
+        self.failed_on[cell_id].add(channel)
+        if len(self.failed_on[cell_id]) >= self.max_attempts:
+            print(f"[coordinator] Giving up on {cell_id} after failing on {len(self.failed_on[cell_id])} workers")
+            self.results[cell_id] = None
+        elif cell_id not in self.pending:
+            self.pending.append(cell_id)
+
+    def can_run(self, channel: ControlChannel, cell_id: str) -> bool:
+        return channel not in self.quarantined and channel not in self.failed_on[cell_id]
+
+    def dispatch(self) -> None:
+        """Lease pending cells in order, each to an idle worker that has not failed it."""
+        for cell_id in list(self.pending):
+            if cell_id in self.results:
+                self.pending.remove(cell_id)
+                continue
+            channel = next((c for c in reversed(self.idle) if self.can_run(c, cell_id)), None)
+            if channel is None:
+                continue
+            self.pending.remove(cell_id)
+            self.idle.remove(channel)
+            self.next_lease += 1
+            try:
+                channel.send({'cmd': 'run', 'lease': self.next_lease, 'cell': self.cells[cell_id]})
+            except OSError:
+                self.pending.appendleft(cell_id)
+                self.drop(channel)
+                continue
+            self.leases[self.next_lease] = (cell_id, channel, time.time() + self.lease_timeout)
+
+    def give_up_stalled(self) -> None:
+        """
+        Once every connected worker is idle and none of them may run any pending
+        cell (all failed it or are quarantined), no lease can ever be handed out
+        again unless a new worker joins; record those cells as failed.
+        """
+        if not self.pending or self.leases or not self.channels or len(self.idle) < len(self.channels):
+            return
+        if any(self.can_run(channel, cell_id) for channel in self.idle for cell_id in self.pending):
+            return
+        for cell_id in self.pending:
+            if cell_id not in self.results:
+                print(f"[coordinator] Giving up on {cell_id}: no worker left that has not failed it")
+                self.results[cell_id] = None
+        self.pending.clear()
+
+
+def work(address: str, run_cell: Callable[[Dict], Optional[Dict]]) -> None:
+    """Worker loop: take leases from the coordinator, run them and stream back results."""
+    channel = ControlChannel(connect(address))
+    channel.send({'ready': True, 'host': socket.gethostname()})
+    try:
+        while True:
+            msg = channel.recv()
+            if msg is None or msg.get('cmd') == 'exit':
+                break
+            reply = {'ready': True, 'lease': msg['lease'], 'cell': msg['cell']['id']}
+            try:
+                reply['result'] = run_cell(msg['cell'])
+            except Exception as e:
+                reply['error'] = repr(e)
+            channel.send(reply)
+    finally:
+        channel.close()
+
+
+def start_local_worker(address: str, script: str, args: List[str]) -> subprocess.Popen:
+    """Start `script --worker address` as a worker process on this host."""
+    return subprocess.Popen([sys.executable, script, '--worker', address] + args, start_new_session=True)
@@ -0,0 +1,270 @@
+from typing import Dict, List, Optional
+
+import numpy as np
+
+RENO = 0
+CUBIC = 1
+ALGORITHMS = {'reno': RENO, 'cubic': CUBIC}
+CUBIC_ONLY = ('C', 'beta')  # parameters Reno ignores
+
+DROPTAIL = 0
+CODEL = 1
+PIE = 2
+FQ_CODEL = 3  # each config carries a single flow, so it behaves as CoDel on that flow's queue
+QUEUES = {'droptail': DROPTAIL, 'codel': CODEL, 'pie': PIE, 'fq_codel': FQ_CODEL}
+PIE_UPDATE = 0.015  # s, PIE drop probability update interval (RFC 8033)
+
+AVERAGE_SEGMENT_SIZE = 80  # same throughput unit as helpers.print_performance
+MTU_BITS = 1500 * 8
+
+DEFAULTS = {
+    'alg': CUBIC,
+    'slow_start_thresh': 10.0,
+    'initial_cwnd': 1.0,
+    'C': 0.4,
+    'beta': 0.7,  # cubic multiplicative decrease, as in CubicStrategy
+    'queue_size': 26400.0,  # bytes, droptail
+    'bandwidth_mbps': 10.0,
+    'delay_ms': 88.0,  # one way, mm-delay applies it in both directions
+    'rate_lambda': np.nan,  # sender packet rate cap (packets/s); NaN = twice the link rate, as settings.LAMBDAS
+    'packet_bytes': 1500.0,  # bytes one packet occupies in the bottleneck queue
+    'queue': DROPTAIL,  # AQM in front of the queue_size limit, one of QUEUES
+    'codel_target': 0.005,  # s, as mahimahi's codel target=5
+    'codel_interval': 0.1,  # s
+    'pie_qdelay_ref': 0.015,  # s, as mahimahi's pie qdelay_ref=15
+    'pie_max_burst': 0.15,  # s
+    'pie_alpha': 0.125,
+    'pie_beta': 1.25,
+}
+
+
+def pie_scale(prob: np.ndarray) -> np.ndarray:
+    """RFC 8033 auto-tuning: smaller steps while the drop probability is small."""
+    return np.select([prob < 1e-6, prob < 1e-5, prob < 1e-4, prob < 1e-3, prob < 1e-2, prob < 1e-1],
+                     [1 / 2048, 1 / 512, 1 / 128, 1 / 32, 1 / 8, 1 / 2], 1.0)
+
+
+def params_from_setting(setting: Dict) -> Dict:
+    """Fluid parameters for one of settings.EXP_SETTINGS (lambda is twice the link rate in MTU packets)."""
+    return {
+        'bandwidth_mbps': setting['lambda'] * MTU_BITS / 2 / 1e6,
+        'delay_ms': setting['mahimahi']['delay'],
+        'queue_size': setting['mahimahi']['queue_size'],
+        'queue': QUEUES[setting['mahimahi'].get('queue', 'droptail')],
+    }
+
+
+def grid(**axes) -> Dict[str, np.ndarray]:
+    """Cartesian product of parameter axes, flattened to one config per element."""
+    names = list(axes)
+    values = [np.atleast_1d(np.asarray(axes[name], dtype=float)) for name in names]
+    mesh = np.meshgrid(*values, indexing='ij')
+    return {name: m.ravel() for name, m in zip(names, mesh)}
+
+
+def concat(*param_sets: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    """Stack several parameter sets (missing keys take DEFAULTS) into one batch."""
+    sizes = [len(next(iter(p.values()))) for p in param_sets]
+    keys = set().union(*param_sets)
+    return {key: np.concatenate([np.broadcast_to(np.asarray(p.get(key, DEFAULTS[key]), dtype=float), (n,))
+                                 for p, n in zip(param_sets, sizes)]) for key in keys}
+
+
+def simulate(params: Dict[str, np.ndarray], duration=60.0, dt=0.001) -> Dict[str, np.ndarray]:
+    """
+    Advance Reno/Cubic window dynamics against a droptail, CoDel or PIE
+    bottleneck for every config at once. Window rules mirror
+    RenoStrategy/CubicStrategy: +1 per ACK in slow start, +1/cwnd per ACK (Reno)
+    or the CubicStrategy cubic curve in congestion avoidance, and at most one
+    multiplicative decrease per RTT on a drop.
+    """
+    n = max(len(np.atleast_1d(v)) for v in params.values())
+    p = {key: np.broadcast_to(np.asarray(params.get(key, value), dtype=float), (n,)).copy()
+         for key, value in DEFAULTS.items()}
+    is_cubic = p['alg'] == CUBIC
+    link_bytes_per_s = p['bandwidth_mbps'] * 1e6 / 8
+    base_rtt = 2 * p['delay_ms'] / 1000
+    rate_lambda = np.where(np.isnan(p['rate_lambda']), 2 * p['bandwidth_mbps'] * 1e6 / MTU_BITS, p['rate_lambda'])
+
+    cwnd = p['initial_cwnd'].copy()
+    ssthresh = p['slow_start_thresh'].copy()
+    w_max = p['initial_cwnd'].copy()
+    t_start = np.zeros(n)
+    last_loss = np.full(n, -np.inf)
+    queue = np.zeros(n)
+
+    acked = np.zeros(n)
+    rtt_weighted = np.zeros(n)
+    cwnd_weighted = np.zeros(n)
+    queue_delay_sum = np.zeros(n)
+    loss_events = np.zeros(n)
+    drops = np.zeros(n)
+
+    # CoDel state
+    is_codel = (p['queue'] == CODEL) | (p['queue'] == FQ_CODEL)
+    first_above = np.full(n, np.inf)
+    dropping = np.zeros(n, dtype=bool)
+    drop_next = np.zeros(n)
+    drop_count = np.ones(n)
+
+    # PIE state
+    is_pie = p['queue'] == PIE
+    drop_prob = np.zeros(n)
+    qdelay_old = np.zeros(n)
+    burst_allowance = p['pie_max_burst'].copy()
+    drop_credit = np.zeros(n)
+    next_pie_update = 0.0
+
+    steps = int(duration / dt)
+    for step in range(steps):
+        t = step * dt
+        rtt = base_rtt + queue / link_bytes_per_s
+        rate = np.minimum(cwnd / rtt, rate_lambda)  # packets/s
+
+        arriving = rate * dt * p['packet_bytes']
+        served = np.minimum(queue + arriving, link_bytes_per_s * dt)
+        queue = queue + arriving - served
+        overflow = queue > p['queue_size']
+        drops += np.maximum(queue - p['queue_size'], 0) / p['packet_bytes']
+        queue = np.minimum(queue, p['queue_size'])
+        sojourn = queue / link_bytes_per_s
+        dropped = overflow
+
+        if is_codel.any():
+            above = is_codel & (sojourn >= p['codel_target'])
+            dropping &= above
+            first_above = np.where(above, np.where(np.isinf(first_above), t + p['codel_interval'], first_above), np.inf)
+            enter = above & ~dropping & (t >= first_above)
+            dropping |= enter
+            drop_count = np.where(enter, 1.0, drop_count)
+            drop_next = np.where(enter, t, drop_next)
+            codel_drop = dropping & (t >= drop_next)
+            drop_next = np.where(codel_drop, t + p['codel_interval'] / np.sqrt(drop_count), drop_next)
+            drop_count += codel_drop
+            dropped = dropped | codel_drop
+
+        if is_pie.any():
+            if t >= next_pie_update:
+                next_pie_update += PIE_UPDATE
+                delta = p['pie_alpha'] * (sojourn - p['pie_qdelay_ref']) + p['pie_beta'] * (sojourn - qdelay_old)
+                drop_prob = np.where(is_pie, np.clip(drop_prob + delta * pie_scale(drop_prob), 0.0, 1.0), drop_prob)
+                idle = (sojourn < p['pie_qdelay_ref'] / 2) & (qdelay_old < p['pie_qdelay_ref'] / 2) & (drop_prob == 0)
+                burst_allowance = np.where(idle, p['pie_max_burst'], np.maximum(0.0, burst_allowance - PIE_UPDATE))
+                qdelay_old = sojourn
+            may_drop = is_pie & (burst_allowance <= 0) & ((sojourn >= p['pie_qdelay_ref'] / 2) | (drop_prob >= 0.2))
+            # Deterministic thinning: drop one packet per accumulated unit of probability
+            drop_credit += np.where(may_drop, drop_prob * arriving / p['packet_bytes'], 0.0)
+            pie_drop = drop_credit >= 1.0
+            drop_credit -= pie_drop
+            dropped = dropped | pie_drop
+
+        aqm_drop = dropped & ~overflow
+        if aqm_drop.any():
+            queue = np.where(aqm_drop, np.maximum(queue - p['packet_bytes'], 0.0), queue)
+            drops += aqm_drop
+
+        delivered = served / p['packet_bytes']
+        acked += delivered
+        rtt_weighted += delivered * rtt
+        cwnd_weighted += delivered * cwnd
+        queue_delay_sum += queue / link_bytes_per_s
+
+        # Window growth
+        in_slow_start = cwnd < ssthresh
+        K = np.cbrt(w_max / p['C'])
+        cubic_cwnd = np.maximum(1.0, p['C'] * (t - t_start - K) ** 3 + w_max)
+        cwnd = np.where(in_slow_start, cwnd + delivered,
+                        np.where(is_cubic, cubic_cwnd, cwnd + delivered / np.maximum(cwnd, 1.0)))
+
+        # Multiplicative decrease, once per RTT
+        loss = dropped & (t - last_loss > rtt)
+        if loss.any():
+            new_ssthresh = np.maximum(1.0, np.floor(cwnd / 2))
+            reduced = np.where(is_cubic, np.maximum(new_ssthresh, cwnd * p['beta']), new_ssthresh)
+            ssthresh = np.where(loss, new_ssthresh, ssthresh)
+            cwnd = np.where(loss, reduced, cwnd)
+            w_max = np.where(loss & is_cubic, cwnd, w_max)
+            t_start = np.where(loss, t, t_start)
+            last_loss = np.where(loss, t, last_loss)
+            loss_events += loss
+
+    safe_acked = np.maximum(acked, 1e-9)
+    return {
+        'Throughput': AVERAGE_SEGMENT_SIZE * acked / duration,
+        'RTT': rtt_weighted / safe_acked * 1000,
+        'CWND': cwnd_weighted / safe_acked,
+        'Queueing Delay': queue_delay_sum / steps * 1000,
+        'Loss Events': loss_events,
+        'Drops': drops,
+        'Utilization': acked * p['packet_bytes'] / (link_bytes_per_s * duration),
+    }
+
+
+def top_k(params: Dict[str, np.ndarray], results: Dict[str, np.ndarray], metric='Throughput', k=10,
+          largest=True) -> List[Dict]:
+    """The k best configs by metric, as dicts of parameters and results."""
+    order = np.argsort(results[metric])
+    order = order[::-1][:k] if largest else order[:k]
+    return [{**{key: float(v[i]) for key, v in params.items()},
+             **{key: float(v[i]) for key, v in results.items()}} for i in order]
+
+
+def observed_means(exp_results: Dict, metrics=('Throughput', 'RTT')) -> Dict:
+    """
+    {setting: {alg: {metric: mean over runs}}} from a main.py results file. Failed
+    runs (None in a distributed results file) are skipped, and so is a setting
+    without any completed run.
+    """
+    observed = {}
+    for alg in ALGORITHMS:
+        for setting, values in exp_results.get(alg, {}).items():
+            runs = {m: [v for v in values[m] if v is not None] for m in metrics}
+            if all(runs.values()):
+                observed.setdefault(setting, {})[alg] = {m: float(np.mean(runs[m])) for m in metrics}
+    return observed
+
+
+def calibrate(observed: Dict, settings: Dict, packet_bytes=(80, 150, 300, 600, 1000, 1500),
+              duration=60.0, dt=0.001, metrics=('Throughput', 'RTT')) -> Dict:
+    """
+    Pick the effective packet size that makes the fluid model match packet-level
+    Reno/Cubic results best (mean absolute log error over settings, algorithms
+    and metrics). All candidates are simulated in one batch.
+    """
+    cells = [(setting, alg) for setting in observed for alg in observed[setting] if setting in settings]
+    batches = []
+    for setting, alg in cells:
+        base = {key: np.full(len(packet_bytes), value) for key, value in params_from_setting(settings[setting]).items()}
+        batches.append({**base, 'alg': np.full(len(packet_bytes), ALGORITHMS[alg]),
+                        'packet_bytes': np.asarray(packet_bytes, dtype=float)})
+    results = simulate(concat(*batches), duration, dt)
+
+    errors = np.zeros(len(packet_bytes))
+    for i, (setting, alg) in enumerate(cells):
+        sl = slice(i * len(packet_bytes), (i + 1) * len(packet_bytes))
+        for m in metrics:
+            errors += np.abs(np.log(np.maximum(results[m][sl], 1e-9) / observed[setting][alg][m]))
+    errors /= max(1, len(cells) * len(metrics))
+    best = int(np.argmin(errors))
+    return {'packet_bytes': float(packet_bytes[best]), 'error': float(errors[best]),
+            'errors': dict(zip(map(float, packet_bytes), errors.tolist()))}
+
+
+def sweep(setting: Dict, axes: Dict[str, List], calibration: Optional[Dict] = None,
+          duration=60.0, dt=0.001):
+    """
+    Screen a design space around one experiment setting; axes override its
+    parameters. Cubic-only axes are crossed with the cubic configs only, so
+    each Reno config is simulated once.
+    """
+    base = params_from_setting(setting)
+    if calibration:
+        base['packet_bytes'] = calibration['packet_bytes']
+    axes = {**{key: [value] for key, value in base.items()}, **axes}
+    algs = axes.pop('alg', [DEFAULTS['alg']])
+    param_sets = []
+    for alg in algs:
+        alg_axes = {key: values for key, values in axes.items() if alg == CUBIC or key not in CUBIC_ONLY}
+        param_sets.append(grid(alg=[alg], **alg_axes))
+    params = concat(*param_sets)
+    return params, simulate(params, duration, dt)
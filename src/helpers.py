@@ -1,14 +1,28 @@
 import os
+import time
 import subprocess
-import matplotlib.pyplot as plt
+import tempfile
 from subprocess import Popen
 import socket
 from threading import Thread
 from typing import Dict, List
 from src.sender import Sender
+from src.worker import ReceiverWorker, stop_process_group, STOP_TIMEOUT
+from src.capture import CaptureReader, ACK, DUP_ACK, CWND, RUN, FLAG_SEQUENTIAL
+from src.kernel_tcp import KernelTcpSender
 
 RECEIVER_FILE = "run_receiver.py"
 AVERAGE_SEGMENT_SIZE = 80
+WHOLE_RUN_FIELDS = ['Startup Time', 'Startup Loss', 'Time to Full Utilization']  # not cut to the steady state
+
+# Downlink queue disciplines mahimahi provides, with their default queue args.
+# The queue capacity always comes from the setting's queue_size (bytes).
+QUEUE_DISCIPLINES = {
+    'droptail': {},
+    'drophead': {},
+    'codel': {'target': 5, 'interval': 100},  # ms
+    'pie': {'qdelay_ref': 15, 'max_burst': 150},  # ms
+}
 
 
 def check_current_algorithm():
@@ -42,20 +56,40 @@ def get_open_udp_port():
     return port
 
 
+def cal_jitter(rtt_values): # RFC 3550
+    jitter = 0
+    for i in range(1, len(rtt_values)):
+        diff = abs(rtt_values[i] - rtt_values[i-1])
+        jitter += (diff - jitter) / 16
+    return jitter
+
+
 def print_performance(sender: Sender, num_seconds: int, print_flag):
-    def cal_jitter(rtt_values): # RFC 3550
-        jitter = 0
-        for i in range(1, len(rtt_values)):
-            diff = abs(rtt_values[i] - rtt_values[i-1])
-            jitter += (diff - jitter) / 16
-        return jitter
-    
     try:
-        total_acks = sender.strategy.total_acks
-        num_duplicate_acks = sender.strategy.num_duplicate_acks
-        sequential_ack_ratio = sender.strategy.sequential_ack_ratio()
-        rtts = sender.strategy.rtts
-        ack_count = sender.strategy.ack_count
+        strategy = sender.strategy
+        total_acks = strategy.total_acks
+        num_duplicate_acks = strategy.num_duplicate_acks
+        sequential_ack_ratio = strategy.sequential_ack_ratio()
+        rtts = strategy.rtts
+        ack_count = strategy.ack_count
+        cwnds = strategy.cwnds
+        ack_times = strategy.times_of_acknowledgements
+        ce_count, ecn_reductions, timeouts = strategy.ce_count, strategy.ecn_reductions, strategy.timeouts
+        steady = sender.steady_state.summary() if getattr(sender, 'steady_state', None) else None
+        if steady:
+            # Only measure the steady state: from the end of the warm-up to the last snapshot
+            start, end = steady['start'], steady['end']
+            rtts = rtts[start['rtt_index']:end['rtt_index']]
+            cwnds = cwnds[start['cwnd_index']:end['cwnd_index']]
+            ack_times = ack_times[start['cwnd_index']:end['cwnd_index']]
+            ack_count = end['ack_index'] - start['ack_index']
+            total_acks = end['total_acks'] - start['total_acks']
+            num_duplicate_acks = end['dup_acks'] - start['dup_acks']
+            sequential_ack_ratio = (end['sequential_acks'] - start['sequential_acks']) / total_acks
+            ce_count = end['ce_count'] - start['ce_count']
+            ecn_reductions = end['ecn_reductions'] - start['ecn_reductions']
+            timeouts = end['timeouts'] - start['timeouts']
+            num_seconds = steady['steady_time']
         throughput = AVERAGE_SEGMENT_SIZE * (ack_count / num_seconds)
         avg_rtt = (float(sum(rtts)) / len(rtts)) * 1000 if rtts else float('inf')
         total_sent_packets = sender.strategy.total_sent_packets  # 获取总发送包数
@@ -72,15 +106,30 @@ def print_performance(sender: Sender, num_seconds: int, print_flag):
             print(f"  Average RTT (ms): {avg_rtt:.2f}")
             print(f"  Packet Loss Rate: {loss_rate:.2f}%")
             print(f"  Jitter (ms): {jitter:.2f}")
+            if steady:
+                print(f"  Warm-up (s): {steady['warmup_time']:.2f}, run length (s): {sender.elapsed:.2f}")
 
-        return {
+        results = {
             'Duplicate ACK': round(num_duplicate_acks / total_acks * 100, 2),
             'Sequential Ack': round(sequential_ack_ratio, 2),
             'Throughput': round(throughput, 2),
             'RTT': round(avg_rtt, 2),
             'Jitter': round(jitter, 2),
-            'CWND': sender.strategy.cwnds
+            'CWND': cwnds,
+            'CWND Time': [round(t, 4) for t, _ in ack_times],
+            'ECN Marks': ce_count,
+            'ECN Reductions': ecn_reductions,
+            'Startup Time': round(strategy.startup_end, 3) if strategy.startup_end is not None else None,
+            'Startup Loss': strategy.startup_dup_acks,
+            'Timeouts': timeouts,
         }
+        if steady:
+            results['Warm-up'] = round(steady['warmup_time'], 2)
+            results['Duration'] = round(sender.elapsed, 2)
+            results['Converged'] = steady['converged']
+            # Startup metrics describe the warm-up itself and stay whole-run values
+            results['Whole-run Fields'] = WHOLE_RUN_FIELDS
+        return results
 
     except ZeroDivisionError:
         print(f"Error: No valid data for sender {sender.port}. Check the experiment setup.")
@@ -88,11 +137,131 @@ def print_performance(sender: Sender, num_seconds: int, print_flag):
         print(f"Error: Missing attributes in strategy for sender {sender.port}: {e}")
 
 
+def time_to_utilization(ack_times: List[float], capacity: float, fraction=0.9, window=0.1):
+    """
+    Seconds until the ACK rate over a sliding window first reaches `fraction`
+    of the link capacity (packets/s); every ACK stands for one delivered segment.
+    """
+    target = fraction * capacity * window
+    start = 0
+    for end, t in enumerate(ack_times):
+        while t - ack_times[start] > window:
+            start += 1
+        if end - start + 1 >= target:
+            return round(t, 3)
+    return None
+
+
+def replay_performance(capture_file: str, num_seconds=None, start=None, end=None):
+    """
+    Recompute the print_performance metrics offline from a sender capture log.
+    start/end (seconds since the first record) restrict the window, e.g. to the
+    steady state. num_seconds defaults to the length of that window, or without
+    one to the run's seconds_to_run, as print_performance uses.
+    'Duplicate ACK' comes from the strategy's own num_duplicate_acks, logged with
+    every DUP_ACK record, not from counting those records: Reno resets it on each
+    fast retransmit and Cubic counts fast retransmits. Over a window it is the
+    counter's change across the window, as for a steady-state run.
+    """
+    records = list(CaptureReader(capture_file).records())
+    if not records:
+        return None
+    t0 = records[0][0]
+    start_ns = t0 + int((start or 0) * 1e9)
+    end_ns = t0 + int(end * 1e9) if end is not None else records[-1][0]
+
+    total_acks = ack_count = sequential_acks = 0
+    dup_counter_start = dup_counter_end = 0  # num_duplicate_acks before and at the end of the window
+    rtts, cwnds, cwnd_times = [], [], []
+    cwnd = run_seconds = None
+    for ts_ns, kind, flags, port, seq_num, value in records:
+        if kind == CWND:
+            cwnd = value
+        elif kind == RUN:
+            run_seconds = value
+        elif kind == DUP_ACK and ts_ns < start_ns:
+            dup_counter_start = dup_counter_end = value
+        if ts_ns < start_ns or ts_ns > end_ns or kind not in (ACK, DUP_ACK):
+            continue
+        total_acks += 1
+        if kind == ACK:
+            ack_count += 1
+            rtts.append(value)
+            if flags & FLAG_SEQUENTIAL:
+                sequential_acks += 1
+        else:
+            dup_counter_end = value
+        cwnds.append(cwnd)
+        cwnd_times.append(round((ts_ns - t0) / 1e9, 4))
+
+    if num_seconds is None:
+        if start is None and end is None and run_seconds is not None:
+            num_seconds = run_seconds
+        else:
+            num_seconds = (end_ns - start_ns) / 1e9
+    if total_acks == 0 or num_seconds <= 0:
+        return None
+    num_duplicate_acks = int(dup_counter_end - dup_counter_start)
+    avg_rtt = (float(sum(rtts)) / len(rtts)) * 1000 if rtts else float('inf')
+    return {
+        'Duplicate ACK': round(num_duplicate_acks / total_acks * 100, 2),
+        'Sequential Ack': round(sequential_acks / total_acks, 2),
+        'Throughput': round(AVERAGE_SEGMENT_SIZE * (ack_count / num_seconds), 2),
+        'RTT': round(avg_rtt, 2),
+        'Jitter': round(cal_jitter(rtts), 2),
+        'CWND': cwnds,
+        'CWND Time': cwnd_times
+    }
+
+
+def print_tcp_performance(sender: KernelTcpSender, num_seconds: int, print_flag):
+    """
+    Same result schema as print_performance, from TCP_INFO samples. Throughput is
+    real bytes acked per second; 'Duplicate ACK' is the retransmitted share of
+    data segments and 'Sequential Ack' its complement, as the kernel exposes no
+    per-ACK classification.
+    """
+    if len(sender.samples) < 2:
+        print(f"Error: No TCP_INFO samples for sender {sender.port}. Check the experiment setup.")
+        return None
+
+    last = sender.samples[-1][1]
+    srtts = [info['rtt'] / 1e6 for _, info in sender.samples if info['rtt'] > 0]  # us -> s
+    delivery_rates = [info['delivery_rate'] for _, info in sender.samples if info['delivery_rate'] > 0]
+    data_segs_out = max(1, last['data_segs_out'])
+    retrans_ratio = last['total_retrans'] / data_segs_out
+    throughput = last['bytes_acked'] / (num_seconds or sender.elapsed)
+    avg_rtt = (sum(srtts) / len(srtts)) * 1000 if srtts else float('inf')
+    jitter = cal_jitter(srtts)
+
+    if print_flag:
+        print(f"Results for kernel TCP sender ({sender.cc_alg}) with port {sender.port}:")
+        print(f"  Data segments sent: {last['data_segs_out']}")
+        print(f"  Retransmits: {last['total_retrans']} ({retrans_ratio * 100:.2f}%)")
+        print(f"  Throughput (bytes/s): {throughput:.2f}")
+        print(f"  Average SRTT (ms): {avg_rtt:.2f}")
+        print(f"  Min RTT (ms): {last['min_rtt'] / 1000:.2f}")
+        print(f"  Jitter: {jitter:.2f}")
+
+    return {
+        'Duplicate ACK': round(retrans_ratio * 100, 2),
+        'Sequential Ack': round(1 - retrans_ratio, 2),
+        'Throughput': round(throughput, 2),
+        'RTT': round(avg_rtt, 2),
+        'Jitter': round(jitter, 2),
+        'CWND': [info['snd_cwnd'] for _, info in sender.samples],
+        'CWND Time': [round(t, 4) for t, _ in sender.samples],
+        'Retransmits': last['total_retrans'],
+        'Delivery Rate': round(sum(delivery_rates) / len(delivery_rates), 2) if delivery_rates else 0,
+        'Min RTT': round(last['min_rtt'] / 1000, 2),
+    }
+
+
 def run_without_mahimahi(seconds_to_run: int, sender_ip: str, sender_port: int, senders: List, print_flag=None):
     print("[info] Running withOUT mahimahi")
     # Start the receiver process
     cmd = f"python3 {RECEIVER_FILE} {sender_ip} {sender_port}"
-    receiver_process = Popen(cmd, shell=True)
+    receiver_process = Popen(cmd, shell=True, start_new_session=True)
 
     # Perform handshakes and run senders
     for sender in senders:
@@ -108,31 +277,115 @@ def run_without_mahimahi(seconds_to_run: int, sender_ip: str, sender_port: int,
     for sender in senders:
         results = print_performance(sender, seconds_to_run, print_flag)
 
-    # Terminate the receiver process
-    receiver_process.kill()
+    # Terminate the receiver process and anything it spawned
+    stop_process_group(receiver_process)
     return results
 
 
-def run_with_mahimahi(mahimahi_settings: Dict, seconds_to_run: int, senders: List, print_flag=None):
-    def generate_mahimahi_command(mahimahi_settings: Dict) -> str:
-        if mahimahi_settings.get('loss'):
-            loss_directive = "mm-loss downlink %f" % mahimahi_settings.get('loss')
-        else:
-            loss_directive = ""
-        return "mm-delay {delay} {loss_directive} mm-link traces/{trace_file} traces/{trace_file} --downlink-queue=droptail --downlink-queue-args=bytes={queue_size}".format(
-        delay=mahimahi_settings['delay'],
-        queue_size=mahimahi_settings['queue_size'],
-        loss_directive=loss_directive,
-        trace_file=mahimahi_settings['trace_file']
-        )
-    
+def generate_mahimahi_command(mahimahi_settings: Dict, link_log: str = None) -> str:
+    if mahimahi_settings.get('loss'):
+        loss_directive = "mm-loss downlink %f" % mahimahi_settings.get('loss')
+    else:
+        loss_directive = ""
+
+    queue = mahimahi_settings.get('queue', 'droptail')
+    if queue not in QUEUE_DISCIPLINES:
+        raise ValueError(f"{queue} is not supported by mahimahi. You can choose from {list(QUEUE_DISCIPLINES)}")
+    queue_args = {'bytes': mahimahi_settings['queue_size'], **QUEUE_DISCIPLINES[queue], **mahimahi_settings.get('queue_args', {})}
+    log_directive = f"--downlink-log={link_log}" if link_log else ""
+
+    return "mm-delay {delay} {loss_directive} mm-link traces/{trace_file} traces/{trace_file} --downlink-queue={queue} --downlink-queue-args={queue_args} {log_directive}".format(
+    delay=mahimahi_settings['delay'],
+    queue=queue,
+    queue_args=",".join(f"{key}={value}" for key, value in queue_args.items()),
+    loss_directive=loss_directive,
+    trace_file=mahimahi_settings['trace_file'],
+    log_directive=log_directive
+    )
+
+
+def new_link_log() -> str:
+    fd, path = tempfile.mkstemp(prefix='mm-downlink-', suffix='.log')
+    os.close(fd)
+    return path
+
+
+def parse_link_log(link_log: str, offset=0) -> Dict:
+    """
+    Queueing delay and drop statistics from a mahimahi downlink log, starting at
+    byte offset (so one log can be shared by consecutive runs).
+    Lines: "t + bytes" arrival, "t - bytes delay" departure, "t d count bytes" drop.
+    """
+    delays = []
+    arrivals = drops = 0
+    with open(link_log, 'r') as f:
+        f.seek(offset)
+        for line in f:
+            fields = line.split()
+            if len(fields) < 2 or fields[0] == '#':
+                continue
+            if fields[1] == '-' and len(fields) >= 4:
+                delays.append(float(fields[3]))
+            elif fields[1] == '+':
+                arrivals += 1
+            elif fields[1] == 'd':
+                drops += int(fields[2]) if len(fields) >= 3 else 1
+
+    delays.sort()
+    return {
+        'Queueing Delay': round(sum(delays) / len(delays), 2) if delays else 0.0,
+        'Queueing Delay P95': round(delays[int(0.95 * (len(delays) - 1))], 2) if delays else 0.0,
+        'Drops': drops,
+        'Drop Rate': round(drops / arrivals * 100, 2) if arrivals else 0.0,
+    }
+
+
+def add_link_stats(results: Dict, mahimahi_settings: Dict, link_stats: Dict) -> Dict:
+    """Merge bottleneck statistics into a run's results, with the RTT above the propagation delay."""
+    if results is None:
+        return None
+    results.update(link_stats)
+    results['Queue'] = mahimahi_settings.get('queue', 'droptail')
+    results['RTT Inflation'] = round(results['RTT'] - 2 * mahimahi_settings['delay'], 2)
+    return results
+
+
+def add_receiver_drops(results: Dict, drops) -> Dict:
+    """Losses at the receiver's socket, not the bottleneck, so they can be told apart from congestion."""
+    if results is None:
+        return None
+    results['Receiver Drops'] = drops
+    return results
+
+
+def read_receiver_drops(drops_file: str, timeout=STOP_TIMEOUT):
+    """Drop count a stopped receiver writes on exit (run_receiver.py --drops-file); None if it never did."""
+    deadline = time.time() + timeout
+    while True:
+        with open(drops_file, 'r') as f:
+            content = f.read().strip()
+        if content or time.time() > deadline:
+            break
+        time.sleep(0.05)
+    os.remove(drops_file)
+    return int(content) if content else None
+
+
+def run_with_mahimahi(mahimahi_settings: Dict, seconds_to_run: int, senders: List, print_flag=None, receiver_capture=None,
+                      ecn_threshold=None, shards=1):
     print("[info] Running with mahimahi")
-    mahimahi_cmd = generate_mahimahi_command(mahimahi_settings)
+    link_log = new_link_log()
+    mahimahi_cmd = generate_mahimahi_command(mahimahi_settings, link_log)
 
     sender_ports = " ".join(["$MAHIMAHI_BASE %s" % sender.port for sender in senders])
+    capture_arg = f"--capture {receiver_capture} " if receiver_capture else ""
+    ecn_arg = f"--ecn-threshold {ecn_threshold} " if ecn_threshold is not None else ""
+    shards_arg = f"--shards {shards} " if shards > 1 else ""
+    fd, drops_file = tempfile.mkstemp(prefix='receiver-drops-')
+    os.close(fd)
     
-    cmd = f"{mahimahi_cmd} -- sh -c 'python3 {RECEIVER_FILE} {sender_ports}'"
-    receiver_process = Popen(cmd, shell=True)
+    cmd = f"{mahimahi_cmd} -- sh -c 'python3 {RECEIVER_FILE} {capture_arg}{ecn_arg}{shards_arg}--drops-file {drops_file} {sender_ports}'"
+    receiver_process = Popen(cmd, shell=True, start_new_session=True)
 
     for sender in senders:
         sender.handshake()
@@ -146,8 +399,74 @@ def run_with_mahimahi(mahimahi_settings: Dict, seconds_to_run: int, senders: Lis
     for sender in senders:
         results = print_performance(sender, seconds_to_run, print_flag)
 
-    # Terminate the receiver process
-    receiver_process.kill()
+    # Terminate the receiver process and anything it spawned
+    stop_process_group(receiver_process)
+    results = add_link_stats(results, mahimahi_settings, parse_link_log(link_log))
+    results = add_receiver_drops(results, read_receiver_drops(drops_file))
+    os.remove(link_log)
+    return results
+
+
+def run_kernel_tcp_with_mahimahi(mahimahi_settings: Dict, seconds_to_run: int, senders: List[KernelTcpSender], print_flag=None):
+    """Same as run_with_mahimahi, for kernel TCP senders and a TCP receiver."""
+    print("[info] Running kernel TCP with mahimahi")
+    link_log = new_link_log()
+    mahimahi_cmd = generate_mahimahi_command(mahimahi_settings, link_log)
+
+    sender_ports = " ".join(["$MAHIMAHI_BASE %s" % sender.port for sender in senders])
+
+    cmd = f"{mahimahi_cmd} -- sh -c 'python3 {RECEIVER_FILE} --tcp {sender_ports}'"
+    receiver_process = Popen(cmd, shell=True, start_new_session=True)
+
+    for sender in senders:
+        sender.handshake()
+    threads = [Thread(target=sender.run, args=[seconds_to_run]) for sender in senders]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    for sender in senders:
+        results = print_tcp_performance(sender, seconds_to_run, print_flag)
+
+    stop_process_group(receiver_process)
+    results = add_link_stats(results, mahimahi_settings, parse_link_log(link_log))
+    os.remove(link_log)
+    return results
+
+
+def start_receiver_worker(mahimahi_settings: Dict = None, shards=1) -> ReceiverWorker:
+    """Start a persistent receiver, inside mahimahi unless mahimahi_settings is None."""
+    if not mahimahi_settings:
+        return ReceiverWorker(RECEIVER_FILE, shards=shards)
+    link_log = new_link_log()
+    worker = ReceiverWorker(RECEIVER_FILE, generate_mahimahi_command(mahimahi_settings, link_log), link_log, shards)
+    worker.mahimahi_settings = mahimahi_settings
+    return worker
+
+
+def run_with_worker(worker: ReceiverWorker, seconds_to_run: int, senders: List, print_flag=None, receiver_capture=None,
+                    ecn_threshold=None):
+    """Same as run_with_mahimahi, but reuses an already running receiver worker."""
+    log_offset = os.path.getsize(worker.link_log) if worker.link_log else 0
+    worker.start_run([sender.port for sender in senders], receiver_capture, ecn_threshold)
+
+    for sender in senders:
+        sender.handshake()
+    threads = [Thread(target=sender.run, args=[seconds_to_run]) for sender in senders]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    done = worker.stop_run()
+
+    # Print sender performance
+    for sender in senders:
+        results = print_performance(sender, seconds_to_run, print_flag)
+    results = add_receiver_drops(results, done.get('socket_drops'))
+    if worker.link_log:
+        results = add_link_stats(results, worker.mahimahi_settings, parse_link_log(worker.link_log, log_offset))
     return results
 
 
@@ -0,0 +1,129 @@
+import sys
+import time
+import socket
+import select
+import struct
+from typing import Dict, List, Tuple
+
+# Leading part of Linux struct tcp_info (include/uapi/linux/tcp.h) up to tcpi_delivery_rate
+TCP_INFO = struct.Struct('=8B24I4Q6IQ')
+TCP_INFO_FIELDS = (
+    'state', 'ca_state', 'retransmits', 'probes', 'backoff', 'options', 'wscale', 'flags',
+    'rto', 'ato', 'snd_mss', 'rcv_mss', 'unacked', 'sacked', 'lost', 'retrans', 'fackets',
+    'last_data_sent', 'last_ack_sent', 'last_data_recv', 'last_ack_recv',
+    'pmtu', 'rcv_ssthresh', 'rtt', 'rttvar', 'snd_ssthresh', 'snd_cwnd', 'advmss', 'reordering',
+    'rcv_rtt', 'rcv_space', 'total_retrans',
+    'pacing_rate', 'max_pacing_rate', 'bytes_acked', 'bytes_received',
+    'segs_out', 'segs_in', 'notsent_bytes', 'min_rtt', 'data_segs_in', 'data_segs_out',
+    'delivery_rate',
+)
+CHUNK_SIZE = 64 * 1024
+SAMPLE_INTERVAL = 0.01  # s
+
+
+def tcp_info(sock: socket.socket) -> Dict[str, int]:
+    raw = sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_INFO, 256)
+    if len(raw) < TCP_INFO.size:
+        raise OSError(f"tcp_info too short ({len(raw)} bytes), kernel is too old")
+    return dict(zip(TCP_INFO_FIELDS, TCP_INFO.unpack_from(raw)))
+
+
+def set_socket_congestion_control(sock: socket.socket, algorithm: str) -> None:
+    """Select the congestion control of this socket only (no global sysctl change)."""
+    try:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_CONGESTION, algorithm.encode())
+    except OSError as e:
+        raise ValueError(f"Cannot use {algorithm} on this socket ({e}). "
+                         f"Check net.ipv4.tcp_available_congestion_control / tcp_allowed_congestion_control")
+    current = sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_CONGESTION, 16).rstrip(b'\x00').decode()
+    if current != algorithm:
+        raise ValueError(f"Socket reports {current} instead of {algorithm}")
+
+
+class KernelTcpSender(object):
+    """
+    Bulk TCP sender using the kernel's congestion control. Listens on `port`,
+    the receiver (inside mahimahi) connects to it, then data flows downlink like
+    the UDP senders.
+    """
+    def __init__(self, port: int, cc_alg: str, sample_interval=SAMPLE_INTERVAL) -> None:
+        self.port = port
+        self.cc_alg = cc_alg
+        self.sample_interval = sample_interval
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        set_socket_congestion_control(self.listener, cc_alg)
+        self.listener.bind(('0.0.0.0', port))
+        self.listener.listen(1)
+        self.sock = None
+
+        self.samples: List[Tuple[float, Dict[str, int]]] = []
+        self.elapsed = 0.0
+
+    def handshake(self):
+        self.sock, addr = self.listener.accept()
+        self.listener.close()
+        # Accepted sockets inherit the listener's algorithm; set it again to be explicit
+        set_socket_congestion_control(self.sock, self.cc_alg)
+        self.sock.setblocking(0)
+        print('[sender] Connected to receiver: %s:%s (%s)' % (addr[0], addr[1], self.cc_alg))
+
+    def run(self, seconds_to_run: int):
+        payload = b'x' * CHUNK_SIZE
+        start_time = time.time()
+        next_sample = start_time
+        self.samples = []
+
+        while True:
+            now = time.time()
+            if now - start_time >= seconds_to_run:
+                break
+            if now >= next_sample:
+                self.samples.append((now - start_time, tcp_info(self.sock)))
+                while next_sample <= now:
+                    next_sample += self.sample_interval
+
+            _, writable, errored = select.select([], [self.sock], [self.sock], max(0.0, next_sample - now))
+            if errored:
+                sys.exit('Error occurred to the channel')
+            if writable:
+                try:
+                    self.sock.send(payload)
+                except BlockingIOError:
+                    pass
+
+        self.samples.append((time.time() - start_time, tcp_info(self.sock)))
+        self.elapsed = time.time() - start_time
+        self.sock.close()
+
+
+class KernelTcpReceiver(object):
+    """Connects to every sender and discards what it receives until they close."""
+    def __init__(self, peers: List[Tuple[str, int]]) -> None:
+        self.peers = peers
+        self.socks: List[socket.socket] = []
+
+    def perform_handshakes(self, retries=10):
+        for peer in self.peers:
+            for attempt in range(retries + 1):
+                try:
+                    self.socks.append(socket.create_connection(peer))
+                    print(f"[receiver] Connected to {peer[0]}:{peer[1]}")
+                    break
+                except ConnectionRefusedError:
+                    if attempt == retries:
+                        sys.stderr.write(f'[receiver] Connection to {peer} failed after {retries} retries\n')
+                        return
+                    time.sleep(0.5)
+
+    def run(self):
+        open_socks = list(self.socks)
+        while open_socks:
+            readable, _, _ = select.select(open_socks, [], [])
+            for sock in readable:
+                if not sock.recv(CHUNK_SIZE):
+                    open_socks.remove(sock)
+
+    def cleanup(self):
+        for sock in self.socks:
+            sock.close()
@@ -0,0 +1,180 @@
+import os
+import json
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+MAX_POINTS = 2000  # per series, roughly one or two points per horizontal pixel
+CACHE_VERSION = 1  # bump when a figure function changes its output
+COLORS = ['#CDC1FF', '#074799', '#FF748B']
+
+
+def lttb(x: np.ndarray, y: np.ndarray, n_out: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Largest-Triangle-Three-Buckets downsampling to n_out points."""
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return x, y
+
+    every = (n - 2) / (n_out - 2)
+    idx = np.empty(n_out, dtype=int)
+    idx[0], idx[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, n - 1)
+        if next_end > end:
+            avg_x, avg_y = x[end:next_end].mean(), y[end:next_end].mean()
+        else:
+            avg_x, avg_y = x[-1], y[-1]
+        area = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(np.argmax(area))
+        idx[i + 1] = a
+    return x[idx], y[idx]
+
+
+def minmax_downsample(x: np.ndarray, y: np.ndarray, n_buckets: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Keep the min and max of every equal-width time bucket, so spikes and drops survive."""
+    n = len(x)
+    if n <= 2 * n_buckets:
+        return x, y
+
+    edges = np.searchsorted(x, np.linspace(x[0], x[-1], n_buckets + 1)[1:-1])
+    idx = []
+    for bucket in np.split(np.arange(n), edges):
+        if len(bucket) == 0:
+            continue
+        lo, hi = bucket[np.argmin(y[bucket])], bucket[np.argmax(y[bucket])]
+        idx.extend(sorted({lo, hi}))
+    return x[idx], y[idx]
+
+
+def downsample(t: List[float], values: List[float], max_points=MAX_POINTS, method='minmax'):
+    """Downsample a series keyed on time (t must be non-decreasing and as long as values)."""
+    assert len(t) == len(values), f'{len(t)} times for {len(values)} values'
+    x = np.asarray(t, dtype=float)
+    y = np.asarray([np.nan if v is None else v for v in values], dtype=float)
+    if method == 'lttb':
+        return lttb(x, y, max_points)
+    return minmax_downsample(x, y, max_points // 2)
+
+
+def cwnd_figure(out_path: str, series: List[Dict], title='', max_points=MAX_POINTS, method='minmax') -> str:
+    """series: [{'label', 'time', 'cwnd'}]; time may be None to fall back to ACK index."""
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    fig = plt.figure(figsize=(10, 6))
+    for s in series:
+        t = s.get('time') or list(range(len(s['cwnd'])))
+        x, y = downsample(t, s['cwnd'], max_points, method)
+        plt.plot(x, y, label=s['label'], lw=1)
+
+    plt.title(title)
+    plt.xlabel('Time (s)' if series and series[0].get('time') else 'Index')
+    plt.ylabel('CWND')
+    plt.legend()
+    plt.grid(True)
+    plt.savefig(out_path, bbox_inches='tight')
+    plt.close(fig)
+    return out_path
+
+
+def runs_figure(out_path: str, metric: str, per_level: Dict[str, Dict[str, List[float]]]) -> str:
+    """
+    per_level: {level: {'reno': [...], 'cubic': [...]}}, one subplot per level, log scale.
+    None marks a failed run; it is left out and the other runs keep their run number.
+    """
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    titles = {'low': 'Low Bandwidth Level', 'med': 'Medium Bandwidth Level', 'high': 'High Bandwidth Level'}
+    fig, axes = plt.subplots(1, len(per_level), figsize=(16, 5), sharey=True, squeeze=False)
+    for ax, (level, algs) in zip(axes[0], per_level.items()):
+        x = list(range(1, max(len(algs['reno']), len(algs['cubic'])) + 1))
+        for cc_alg, label, color, marker, linestyle in (('reno', "Reno", COLORS[2], "o", ":"),
+                                                        ('cubic', "Cubic", COLORS[1], "s", "--")):
+            runs = [(i + 1, v) for i, v in enumerate(algs[cc_alg]) if v is not None]
+            ax.plot([r for r, _ in runs], np.log([v for _, v in runs]), label=label, color=color,
+                    marker=marker, linestyle=linestyle, lw=2)
+        ax.set_title(titles.get(level, level))
+        ax.legend(loc="lower left", fontsize=14)
+        ax.set_xlabel("Run", fontsize=12)
+        ax.set_xticks(ticks=x)
+
+    fig.text(0.04, 0.5, f"{metric} (log scale)", va="center", rotation="vertical", fontsize=12)
+    plt.tight_layout(rect=[0.05, 0.05, 1, 1])
+    plt.savefig(out_path, bbox_inches='tight')
+    plt.close(fig)
+    return out_path
+
+
+FIGURES = {
+    'cwnd': cwnd_figure,
+    'runs': runs_figure,
+}
+
+
+def _update_hash(h, value) -> None:
+    if isinstance(value, dict):
+        for key in sorted(value):
+            h.update(str(key).encode())
+            _update_hash(h, value[key])
+    elif isinstance(value, (list, tuple)) and value and isinstance(value[0], (int, float)):
+        # Long numeric series: hash the raw array bytes instead of their text form
+        h.update(np.asarray(value, dtype=float).tobytes())
+    elif isinstance(value, (list, tuple)):
+        h.update(b'[')
+        for item in value:
+            _update_hash(h, item)
+        h.update(b']')
+    else:
+        h.update(json.dumps(value, default=str).encode())
+
+
+def job_hash(kind: str, kwargs: Dict) -> str:
+    h = hashlib.sha256(f'{CACHE_VERSION}:{kind}'.encode())
+    _update_hash(h, kwargs)
+    return h.hexdigest()
+
+
+def _render(kind: str, kwargs: Dict, digest: str) -> str:
+    out_path = FIGURES[kind](**kwargs)
+    with open(out_path + '.hash', 'w') as f:
+        f.write(digest)
+    return out_path
+
+
+def is_cached(out_path: str, digest: str) -> bool:
+    try:
+        with open(out_path + '.hash') as f:
+            return os.path.exists(out_path) and f.read() == digest
+    except FileNotFoundError:
+        return False
+
+
+def render_figures(jobs: List[Tuple[str, Dict]], processes: Optional[int] = None) -> List[str]:
+    """
+    Render (kind, kwargs) figure jobs across a process pool. A figure is skipped
+    when its output exists and the hash of its inputs matches the sidecar .hash file.
+    """
+    pending = []
+    for kind, kwargs in jobs:
+        digest = job_hash(kind, kwargs)
+        if is_cached(kwargs['out_path'], digest):
+            print(f"[plot] cached: {kwargs['out_path']}")
+        else:
+            pending.append((kind, kwargs, digest))
+
+    if not pending:
+        return []
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        futures = [pool.submit(_render, kind, kwargs, digest) for kind, kwargs, digest in pending]
+        rendered = [future.result() for future in futures]
+    for out_path in rendered:
+        print(f"[plot] rendered: {out_path}")
+    return rendered
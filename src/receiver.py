@@ -1,8 +1,11 @@
 import sys
 import json
+import time
 import socket
 import select
-from typing import List, Dict, Tuple
+import struct
+from typing import List, Dict, Optional, Tuple
+from src.capture import CaptureLog, RECV, ACK_SENT
 
 READ_FLAGS = select.POLLIN | select.POLLPRI
 WRITE_FLAGS = select.POLLOUT
@@ -14,6 +17,23 @@ ALL_FLAGS = READ_FLAGS | WRITE_FLAGS | ERR_FLAGS
 # accomodate any reasonable congestion window size.
 RECEIVE_WINDOW = 100000
 
+RECV_BUFFER = 8 * 1024 * 1024  # bytes of socket receive buffer, so bursts are not dropped before we read them
+SO_RXQ_OVFL = getattr(socket, 'SO_RXQ_OVFL', 40)  # Linux: socket drop counter attached to every datagram
+SO_RCVBUFFORCE = getattr(socket, 'SO_RCVBUFFORCE', 33)
+DROP_CMSG_SPACE = socket.CMSG_SPACE(4)
+
+
+def configure_socket(sock: socket.socket) -> None:
+    """Enlarge the receive buffer (past rmem_max if privileged) and turn on the drop counter."""
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, SO_RCVBUFFORCE, RECV_BUFFER)
+    except OSError:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECV_BUFFER)
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, SO_RXQ_OVFL, 1)
+    except OSError:
+        pass  # not Linux, drops go uncounted
+
 class Peer(object):
     def __init__(self, port: int, window_size: int) -> None:
         self.window_size = window_size
@@ -24,6 +44,7 @@ class Peer(object):
         self.high_water_mark = -1
         self.window: List[Dict] = []
         self.total_received_acks = 0
+        self.ce_count = 0  # CE-marked segments received, echoed in every ACK
 
     def window_has_no_missing_segments(self):
         seq_nums = [seg['seq_num'] for seg in self.window]
@@ -56,30 +77,96 @@ class Peer(object):
             return self.window[-1]
 
 class Receiver(object):
-    def __init__(self, peers: List[Tuple[str, int]], window_size: int = RECEIVE_WINDOW) -> None:
+    def __init__(self, peers: List[Tuple[str, int]], window_size: int = RECEIVE_WINDOW,
+                 capture: Optional[CaptureLog] = None, ecn_threshold: Optional[float] = None,
+                 sock: Optional[socket.socket] = None) -> None:
         self.recv_window_size = window_size
+        self.capture = capture
+        self.ecn_threshold = ecn_threshold  # ms of queueing delay above which segments count as CE-marked
+        self.base_delay: Dict[Tuple, float] = {}  # lowest one-way delay seen per peer
         self.peers: Dict[Tuple, Peer] = {}
         for peer in peers:
             self.peers[peer] = Peer(peer[1], window_size)
 
-        # UDP socket and poller
-        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        # Per-flow windows for multiplexed workloads, keyed by (addr, flow_id)
+        self.flows: Dict[Tuple, Peer] = {}
+        self.finished_flows: Dict[Tuple, set] = {peer: set() for peer in peers}
+
+        # UDP socket (or one shard's socket of a ShardedReceiver) and poller
+        if sock is None:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock = sock
+        configure_socket(self.sock)
+        self.drop_count = 0  # kernel's cumulative count of datagrams dropped on this socket
+        self.drop_base = 0  # drop_count when the current peers were set
 
         self.poller = select.poll()
         self.poller.register(self.sock, ALL_FLAGS)
 
     def cleanup(self):
         self.sock.close()
+        if self.capture:
+            self.capture.close()
+
+    def reset(self, peers: List[Tuple[str, int]], capture: Optional[CaptureLog] = None,
+              ecn_threshold: Optional[float] = None):
+        """Forget all peer and flow state and serve a new set of peers on the same socket."""
+        if self.capture:
+            self.capture.close()
+        self.capture = capture
+        self.ecn_threshold = ecn_threshold
+        self.base_delay = {}
+        self.peers = {peer: Peer(peer[1], self.recv_window_size) for peer in peers}
+        self.flows = {}
+        self.finished_flows = {peer: set() for peer in peers}
+        self.drop_base = self.drop_count
+
+    def socket_drops(self) -> int:
+        """Datagrams the kernel dropped on a full receive buffer since the peers were set."""
+        return self.drop_count - self.drop_base
+
+    def recv(self):
+        """recvfrom() that also picks up the socket's drop counter."""
+        serialized_data, ancdata, _, addr = self.sock.recvmsg(1600, DROP_CMSG_SPACE)
+        for level, kind, value in ancdata:
+            if level == socket.SOL_SOCKET and kind == SO_RXQ_OVFL and len(value) >= 4:
+                self.drop_count = struct.unpack('I', value[:4])[0]
+        return serialized_data, addr
 
     def construct_ack(self, serialized_data: str):
         """Construct a serialized ACK that acks a serialized datagram."""
         data = json.loads(serialized_data)
-        return {
+        ack = {
           'seq_num': data['seq_num'],
           'send_ts': data['send_ts'],
           'ack_bytes': len(serialized_data)
         }
+        if 'flow_id' in data:
+            ack['flow_id'] = data['flow_id']
+        return ack
+
+    def ce_marked(self, addr: Tuple, data: Dict) -> bool:
+        """
+        Emulated bottleneck marking: a segment is CE if its queueing delay, its
+        one-way delay above the lowest seen from this peer, exceeds ecn_threshold.
+        Sender and receiver share the host clock, so send_ts is comparable.
+        """
+        delay = time.time() - data['send_ts']
+        base = min(self.base_delay.get(addr, delay), delay)
+        self.base_delay[addr] = base
+        return (delay - base) * 1000 > self.ecn_threshold
+
+    def flow_peer(self, addr: Tuple, data: Dict):
+        """Window for one flow of a multiplexed peer, created on its first segment."""
+        key = (addr, data['flow_id'])
+        if key not in self.flows:
+            self.flows[key] = Peer(addr[1], self.recv_window_size)
+        return self.flows[key]
+
+    def finish_flow(self, addr: Tuple, data: Dict):
+        del self.flows[(addr, data['flow_id'])]
+        self.finished_flows[addr].add(data['flow_id'])
 
     def perform_handshakes(self):
         """Handshake with peer sender. Must be called before run()."""
@@ -118,27 +205,70 @@ class Receiver(object):
                     sys.exit('Channel closed or error occurred')
 
                 if flag & READ_FLAGS:
-                    msg, addr = self.sock.recvfrom(1600)
+                    msg, addr = self.recv()
 
                     if addr in unconnected_peers:
                         if json.loads(msg.decode()).get('handshake'):
                             unconnected_peers.remove(addr)
 
-    def run(self):
-        self.sock.setblocking(1)  # blocking UDP socket
+    def handle_datagram(self, serialized_data: bytes, addr: Tuple):
+        if addr not in self.peers:
+            return
+        peer = self.peers[addr]
 
-        while True:
-            serialized_data, addr = self.sock.recvfrom(1600)
+        data = json.loads(serialized_data)
+        if 'flow_id' in data:
+            if data['flow_id'] in self.finished_flows[addr]:
+                # Retransmission for a completed flow, re-ack its last segment
+                ack = self.construct_ack(serialized_data)
+                ack['seq_num'] = data['flow_size'] - 1
+                self.sock.sendto(json.dumps(ack).encode(), addr)
+                return
+            peer = self.flow_peer(addr, data)
+
+        seq_num = data['seq_num']
+        if self.capture:
+            self.capture.append(RECV, seq_num, port=addr[1])
+        ce = self.ecn_threshold is not None and self.ce_marked(addr, data)
+        peer.ce_count += ce
+        if seq_num > peer.high_water_mark:
+            ack = self.construct_ack(serialized_data)
+            peer.add_segment(ack)
+            # print(len(peer.window))
 
-            if addr in self.peers:
-                peer = self.peers[addr]
+            if peer.next_ack() is not None:
+                reply = peer.next_ack()
+                if self.ecn_threshold is not None:
+                    # Accurate ECN: a cumulative count survives lost and coalesced ACKs
+                    reply = dict(reply, ce=int(ce), ce_count=peer.ce_count)
+                self.sock.sendto(json.dumps(reply).encode(), addr)
+                if self.capture:
+                    self.capture.append(ACK_SENT, peer.next_ack()['seq_num'], port=addr[1])
+
+        if 'flow_id' in data and peer.high_water_mark >= data['flow_size'] - 1:
+            self.finish_flow(addr, data)
+
+    def run(self, control=None):
+        """
+        Serve peers until interrupted or, if a control channel is given, until
+        it becomes readable (the next command is left for the caller to read).
+        """
+        self.sock.setblocking(1)  # blocking UDP socket
 
-                data = json.loads(serialized_data)
-                seq_num = data['seq_num']
-                if seq_num > peer.high_water_mark:
-                    ack = self.construct_ack(serialized_data)
-                    peer.add_segment(ack)
-                    # print(len(peer.window))
+        if control is None:
+            while True:
+                serialized_data, addr = self.recv()
+                self.handle_datagram(serialized_data, addr)
 
-                    if peer.next_ack() is not None:
-                        self.sock.sendto(json.dumps(peer.next_ack()).encode(), addr)
+        poller = select.poll()
+        poller.register(self.sock, READ_ERR_FLAGS)
+        poller.register(control.fileno(), READ_ERR_FLAGS)
+        while True:
+            for fd, flag in poller.poll():
+                if fd == control.fileno():
+                    return
+                if flag & ERR_FLAGS:
+                    sys.exit('Channel closed or error occurred')
+                if flag & READ_FLAGS:
+                    serialized_data, addr = self.recv()
+                    self.handle_datagram(serialized_data, addr)
@@ -0,0 +1,103 @@
+import random
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from scipy import stats
+
+PAIR = ('reno', 'cubic')  # algorithms whose CRN difference is tracked
+
+
+def ci_half_width(samples: List[float], confidence=0.95) -> Tuple[float, float]:
+    """Mean and t-based CI half-width, same as analyze.calculate_stats."""
+    n = len(samples)
+    mean = float(np.mean(samples))
+    if n < 2:
+        return mean, float('inf')
+    se = stats.sem(samples)
+    t_critical = stats.t.ppf((1 + confidence) / 2, df=n-1)
+    return mean, float(t_critical * se)
+
+
+def relative_precision(samples: List[float], confidence=0.95) -> float:
+    mean, hci = ci_half_width(samples, confidence)
+    if mean == 0:
+        return 0.0 if hci == 0 else float('inf')
+    return hci / abs(mean)
+
+
+def seed_for_run(i: int, seeds: List[int]) -> int:
+    """Fixed seeds first, then a deterministic extension so replications stay reproducible."""
+    if i < len(seeds):
+        return seeds[i]
+    return random.Random(i).randrange(10000)
+
+
+class SequentialStopper(object):
+    """
+    Sequential-sampling rule for one experiment cell.
+
+    Each replication adds one value per algorithm (same seed, i.e. CRN). The cell
+    stops once every algorithm's CI half-width is within `rel_precision` of its
+    mean, and the half-width of the reno - cubic difference within
+    `rel_precision` of the metric's mean over both (the difference itself is
+    usually near 0, so relative to it the target would never be met), or at
+    `max_runs`.
+    """
+    def __init__(self, algs: List[str], metric='Throughput', rel_precision=0.05, confidence=0.95,
+                 min_runs=3, max_runs=20) -> None:
+        self.algs = list(algs)
+        self.metric = metric
+        self.rel_precision = rel_precision
+        self.confidence = confidence
+        self.min_runs = min_runs
+        self.max_runs = max_runs
+        self.samples: Dict[str, List[float]] = {alg: [] for alg in self.algs}
+
+    def add(self, alg: str, result: Optional[Dict]) -> None:
+        if result is not None:
+            self.samples[alg].append(result[self.metric])
+
+    def num_runs(self) -> int:
+        return min(len(v) for v in self.samples.values())
+
+    def has_pair(self) -> bool:
+        return all(alg in self.samples for alg in PAIR)
+
+    def paired_diffs(self) -> List[float]:
+        if not self.has_pair():
+            return []
+        n = self.num_runs()
+        first, second = self.samples[PAIR[0]][:n], self.samples[PAIR[1]][:n]
+        return [a - b for a, b in zip(first, second)]
+
+    def diff_precision(self) -> float:
+        """Half-width of the paired difference relative to the metric's mean over both algorithms."""
+        _, hci = ci_half_width(self.paired_diffs(), self.confidence)
+        scale = abs(float(np.mean(self.samples[PAIR[0]] + self.samples[PAIR[1]])))
+        if scale == 0:
+            return 0.0 if hci == 0 else float('inf')
+        return hci / scale
+
+    def precisions(self) -> Dict[str, float]:
+        precisions = {alg: relative_precision(self.samples[alg], self.confidence) for alg in self.algs}
+        if self.has_pair():
+            precisions['diff'] = self.diff_precision()
+        return precisions
+
+    def done(self) -> bool:
+        n = self.num_runs()
+        if n >= self.max_runs:
+            return True
+        if n < self.min_runs:
+            return False
+        return all(p <= self.rel_precision for p in self.precisions().values())
+
+    def summary(self) -> Dict:
+        summary = {'Runs': self.num_runs()}
+        for alg in self.algs:
+            mean, hci = ci_half_width(self.samples[alg], self.confidence)
+            summary[alg] = {'Mean': round(mean, 2), 'HCI': round(hci, 2)}
+        if self.has_pair():
+            mean, hci = ci_half_width(self.paired_diffs(), self.confidence)
+            summary['diff'] = {'Mean': round(mean, 2), 'HCI': round(hci, 2)}
+        return summary
@@ -4,17 +4,22 @@ import socket
 import select
 import time
 from tqdm import tqdm
+from typing import Optional
 from src.strategies import SenderStrategy
+from src.steady_state import SteadyStateDetector
+from src.capture import CaptureLog, SEND, ACK, DUP_ACK, RETRANSMIT, CWND, RUN, FLAG_SEQUENTIAL
 
 READ_FLAGS = select.POLLIN | select.POLLPRI
 WRITE_FLAGS = select.POLLOUT
 ERR_FLAGS = select.POLLERR | select.POLLHUP | select.POLLNVAL
 READ_ERR_FLAGS = READ_FLAGS | ERR_FLAGS
 ALL_FLAGS = READ_FLAGS | WRITE_FLAGS | ERR_FLAGS
+MAX_ACK_BATCH = 256  # ACKs drained per wakeup, so sending is not starved
 
 
 class Sender(object):
-    def __init__(self, port: int, strategy: SenderStrategy) -> None:
+    def __init__(self, port: int, strategy: SenderStrategy, steady_state: Optional[SteadyStateDetector] = None,
+                 capture: Optional[CaptureLog] = None) -> None:
         self.port = port
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
@@ -25,6 +30,10 @@ class Sender(object):
         self.peer_addr = None
 
         self.strategy = strategy
+        self.steady_state = steady_state
+        self.elapsed = 0.0
+        self.capture = capture
+        self.highest_sent = {}  # flow_id -> highest seq_num sent, to tell retransmissions apart
 
         # bind_ip, bind_port = self.sock.getsockname()
         # print(f"Sender: Socket is bound to IP: {bind_ip}, Port: {bind_port}")
@@ -33,11 +42,53 @@ class Sender(object):
         next_segment =  self.strategy.next_packet_to_send()
         if next_segment is not None:
             self.sock.sendto(next_segment.encode(), self.peer_addr) # type: ignore
+            if self.capture:
+                self.capture_send(next_segment)
         time.sleep(0)
 
     def recv(self):
-        serialized_ack, addr = self.sock.recvfrom(1600)
-        self.strategy.process_ack(serialized_ack.decode())
+        """Drain the ACKs queued on the socket and hand them to the strategy as one batch."""
+        batch = []
+        while len(batch) < MAX_ACK_BATCH:
+            try:
+                serialized_ack, addr = self.sock.recvfrom(1600)
+            except BlockingIOError:
+                break
+            batch.append(serialized_ack.decode())
+
+        if self.capture:
+            # Per ACK, so that every event is classified and timestamped on its own
+            for serialized_ack in batch:
+                self.capture_ack(serialized_ack)
+        elif batch:
+            self.strategy.process_acks(batch)
+
+    def capture_send(self, serialized_data: str) -> None:
+        data = json.loads(serialized_data)
+        seq_num, flow_id = data['seq_num'], data.get('flow_id')
+        highest = self.highest_sent.get(flow_id, -1)
+        self.capture.append(RETRANSMIT if seq_num <= highest else SEND, seq_num, port=self.port)
+        self.highest_sent[flow_id] = max(highest, seq_num)
+
+    def capture_ack(self, serialized_ack: str) -> None:
+        """Process one ACK and log how the strategy classified it."""
+        strategy = self.strategy
+        total_acks, ack_count = strategy.total_acks, strategy.ack_count
+        sequential_acks = getattr(strategy, 'sequential_ack_count', 0)
+        cwnd = getattr(strategy, 'cwnd', None)
+        strategy.process_ack(serialized_ack)
+        if strategy.total_acks == total_acks:
+            return  # handshake
+
+        ts_ns = time.time_ns()
+        seq_num = json.loads(serialized_ack)['seq_num']
+        if getattr(strategy, 'cwnd', None) != cwnd:
+            self.capture.append(CWND, seq_num, strategy.cwnd, self.port, ts_ns=ts_ns)
+        if strategy.ack_count > ack_count:
+            flags = FLAG_SEQUENTIAL if getattr(strategy, 'sequential_ack_count', 0) > sequential_acks else 0
+            self.capture.append(ACK, seq_num, strategy.rtts[-1], self.port, flags, ts_ns)
+        else:
+            self.capture.append(DUP_ACK, seq_num, strategy.num_duplicate_acks, self.port, ts_ns=ts_ns)
 
 
     def handshake(self):
@@ -57,10 +108,18 @@ class Sender(object):
     def run(self, seconds_to_run: int):
         """
         Run the sender with a progress bar indicating the elapsed time.
+        With a steady-state detector, seconds_to_run is only a cap and the run
+        ends as soon as the detector reports a stable steady-state estimate.
         """
         curr_flags = ALL_FLAGS
         TIMEOUT = 1000  # ms
         start_time = time.time()
+        if self.steady_state:
+            self.steady_state.start(self.strategy, start_time)
+        if self.capture:
+            self.capture.append(RUN, -1, seconds_to_run, self.port)
+        if self.capture and hasattr(self.strategy, 'cwnd'):
+            self.capture.append(CWND, -1, self.strategy.cwnd, self.port)
 
         # Initialize the progress bar
         with tqdm(total=seconds_to_run, desc="Progress", unit="s") as pbar:
@@ -70,7 +129,21 @@ class Sender(object):
                 # Update the progress bar
                 pbar.update(int(elapsed_time - pbar.n))
 
-                events = self.poller.poll(TIMEOUT)
+                self.strategy.check_timeouts(time.time())
+
+                # A strategy that cannot send now says when it next needs the loop
+                # (paced send or retransmission timeout); until then only wait for ACKs
+                timeout = TIMEOUT
+                flags = ALL_FLAGS
+                wake = self.strategy.next_event_time()
+                if wake is not None and wake - time.time() >= 0.001:
+                    timeout = int((wake - time.time()) * 1000)
+                    flags = READ_ERR_FLAGS
+                if flags != curr_flags:
+                    self.poller.modify(self.sock, flags)
+                    curr_flags = flags
+
+                events = self.poller.poll(timeout)
                 if not events:
                     self.send()
                 for fd, flag in events:
@@ -85,4 +158,10 @@ class Sender(object):
 
                     if flag & WRITE_FLAGS:
                         self.send()
+
+                if self.steady_state and self.steady_state.update(self.strategy, time.time()):
+                    break
+            self.elapsed = time.time() - start_time
             pbar.update(seconds_to_run - pbar.n)
+        if self.capture:
+            self.capture.close()
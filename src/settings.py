@@ -0,0 +1,34 @@
+# Link settings of the experiments, shared by main.py and sweep.py
+# Target packet rate is twice the bandwidth in 1500-byte packets
+
+LAMBDAS = {
+    'low': 2 * 10 * 1e6 / 12000.0,
+    'med': 2 * 30 * 1e6 / 12000.0,
+    'high': 2 * 100 * 1e6 / 12000.0,
+}
+EXP_SETTINGS = {
+    'low': {
+        'mahimahi': {
+            'delay': 88,
+            'queue_size': 26400,
+            'trace_file': 'low_10mbps.trace'
+        },
+        'lambda': LAMBDAS['low']
+    },
+    'med': {
+        'mahimahi': {
+            'delay': 88,
+            'queue_size': 26400,
+            'trace_file': 'med_30mbps.trace'
+        },
+        'lambda': LAMBDAS['med']
+    },
+    'high': {
+        'mahimahi': {
+            'delay': 88,
+            'queue_size': 26400,
+            'trace_file': 'high_100mbps.trace'
+        },
+        'lambda': LAMBDAS['high']
+    }
+}
@@ -0,0 +1,150 @@
+import os
+import sys
+import json
+import ctypes
+import select
+import signal
+import socket
+import struct
+from typing import Dict, List, Optional, Tuple
+from src.receiver import Receiver, RECEIVE_WINDOW, READ_ERR_FLAGS
+from src.capture import CaptureLog
+
+SO_ATTACH_REUSEPORT_CBPF = getattr(socket, 'SO_ATTACH_REUSEPORT_CBPF', 51)
+SKF_NET_OFF = -0x100000  # classic BPF offsets relative to the network header
+IP_HEADER_LEN = 20  # the senders never set IPv4 options
+
+# Classic BPF opcodes
+BPF_LD_H_ABS = 0x28
+BPF_ALU_MOD_K = 0x94
+BPF_RET_A = 0x16
+
+
+def attach_steering(sock: socket.socket, shards: int) -> None:
+    """
+    Steer every datagram of the reuseport group to the socket at index
+    src_port % shards, so each sender is always served by the same shard.
+    The program sees the UDP payload, so the source port is read relative
+    to the network header.
+    """
+    program = [
+        (BPF_LD_H_ABS, 0, 0, (SKF_NET_OFF + IP_HEADER_LEN) & 0xffffffff),  # A = UDP source port
+        (BPF_ALU_MOD_K, 0, 0, shards),  # A %= shards
+        (BPF_RET_A, 0, 0, 0),  # socket index
+    ]
+    filters = ctypes.create_string_buffer(b''.join(struct.pack('HBBI', *insn) for insn in program))
+    fprog = struct.pack('HL', len(program), ctypes.addressof(filters))
+    sock.setsockopt(socket.SOL_SOCKET, SO_ATTACH_REUSEPORT_CBPF, fprog)
+
+
+class ShardedReceiver(object):
+    """
+    Receiver split over `shards` forked processes that share one UDP port via
+    SO_REUSEPORT. The parent binds the sockets in order, so the kernel's
+    reuseport index of shard i is i, and a steering program sends each peer to
+    shard peer_port % shards; a peer's window therefore never leaves its
+    process. Same interface as Receiver, so serve() and run_receiver.py can
+    use either.
+    """
+    def __init__(self, peers: List[Tuple[str, int]], shards: int, window_size: int = RECEIVE_WINDOW,
+                 ecn_threshold: Optional[float] = None) -> None:
+        self.shards = shards
+        self.recv_window_size = window_size
+        self.ecn_threshold = ecn_threshold
+        self.peers = list(peers)
+        self.children: Dict[int, Tuple[int, socket.socket]] = {}  # pid -> (shard, control socket)
+        self.drops: List[int] = []  # socket drops per shard in the last run
+
+        self.socks = []
+        for _ in range(shards):
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+            sock.bind(('0.0.0.0', self.socks[0].getsockname()[1] if self.socks else 0))
+            self.socks.append(sock)
+        attach_steering(self.socks[0], shards)
+        # Every shard builds its Receiver on its own socket; this also sizes the buffers
+        self.receivers = [Receiver([], window_size, sock=sock) for sock in self.socks]
+
+    def shard_of(self, peer: Tuple[str, int]) -> int:
+        return peer[1] % self.shards
+
+    def reset(self, peers: List[Tuple[str, int]], capture: Optional[CaptureLog] = None,
+              ecn_threshold: Optional[float] = None):
+        if capture:
+            raise ValueError('Receiver capture logs need a single receiver shard')
+        self.peers = list(peers)
+        self.ecn_threshold = ecn_threshold
+
+    def perform_handshakes(self):
+        """Fork one process per shard; each handshakes with its own peers and serves them."""
+        for shard, receiver in enumerate(self.receivers):
+            parent_end, child_end = socket.socketpair()
+            pid = os.fork()
+            if pid == 0:
+                parent_end.close()
+                self.serve_shard(receiver, shard, child_end)
+            child_end.close()
+            self.children[pid] = (shard, parent_end)
+
+    def serve_shard(self, receiver: Receiver, shard: int, control: socket.socket):
+        """Child process: serve this shard's peers until the parent writes to control."""
+        status = 0
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        # The parent stops the shards and collects their drop counts; if it dies, control reads EOF
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+        try:
+            receiver.reset([peer for peer in self.peers if self.shard_of(peer) == shard],
+                           ecn_threshold=self.ecn_threshold)
+            receiver.perform_handshakes()
+            receiver.run(control=control)
+            # The counter is per socket and cumulative; the parent keeps the previous value
+            control.sendall(json.dumps({'drop_count': receiver.drop_count}).encode() + b'\n')
+        except BaseException as e:
+            sys.stderr.write(f'[receiver] Shard {shard} failed: {e!r}\n')
+            status = 1
+        finally:
+            os._exit(status)
+
+    def run(self, control=None):
+        """Wait until interrupted or until control becomes readable, then stop the shards."""
+        poller = select.poll()
+        if control is not None:
+            poller.register(control.fileno(), READ_ERR_FLAGS)
+        for _, child in self.children.values():
+            poller.register(child.fileno(), READ_ERR_FLAGS)
+        try:
+            while True:
+                events = poller.poll()
+                if control is not None and any(fd == control.fileno() for fd, _ in events):
+                    break
+                if events:
+                    sys.exit('[receiver] A receiver shard exited')
+        finally:
+            self.stop_shards()
+
+    def stop_shards(self):
+        if not self.children:
+            return
+        self.drops = [0] * self.shards
+        for pid, (shard, child) in self.children.items():
+            try:
+                child.sendall(b'stop')
+                reply = child.makefile('rb').readline()
+            except OSError:
+                reply = b''  # shard already gone
+            if reply:
+                receiver = self.receivers[shard]
+                drop_count = json.loads(reply)['drop_count']
+                self.drops[shard] = drop_count - receiver.drop_count
+                receiver.drop_count = drop_count
+            child.close()
+            os.waitpid(pid, 0)
+        self.children = {}
+
+    def socket_drops(self) -> int:
+        return sum(self.drops)
+
+    def cleanup(self):
+        self.stop_shards()
+        for receiver in self.receivers:
+            receiver.cleanup()
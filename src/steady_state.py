@@ -0,0 +1,131 @@
+import math
+from typing import Dict, List, Optional
+
+# Two-sided 95% t critical values by degrees of freedom, for the batch-means CI
+T_CRITICAL_95 = {4: 2.776, 5: 2.571, 6: 2.447, 7: 2.365, 8: 2.306, 9: 2.262, 14: 2.145, 19: 2.093}
+
+
+def mser_truncation(samples: List[float], batch_size=5) -> int:
+    """
+    MSER-m warm-up truncation point (in samples, a multiple of batch_size).
+
+    Samples are averaged into batches of batch_size, then the truncation d that
+    minimises sum((z_i - mean(z[d:]))^2) / (n - d)^2 is searched over the first
+    half of the batches.
+    """
+    n_batches = len(samples) // batch_size
+    if n_batches < 2:
+        return 0
+    batches = [sum(samples[i*batch_size:(i+1)*batch_size]) / batch_size for i in range(n_batches)]
+
+    best_d, best_stat = 0, float('inf')
+    for d in range(n_batches // 2 + 1):
+        tail = batches[d:]
+        mean = sum(tail) / len(tail)
+        stat = sum((z - mean) ** 2 for z in tail) / len(tail) ** 2
+        if stat < best_stat:
+            best_d, best_stat = d, stat
+    return best_d * batch_size
+
+
+def batch_means_precision(samples: List[float], num_batches=10) -> float:
+    """Relative half-width of the 95% batch-means CI of the mean of samples."""
+    batch_size = len(samples) // num_batches
+    if batch_size < 1:
+        return float('inf')
+    batches = [sum(samples[i*batch_size:(i+1)*batch_size]) / batch_size for i in range(num_batches)]
+    mean = sum(batches) / num_batches
+    if mean == 0:
+        return float('inf')
+    variance = sum((z - mean) ** 2 for z in batches) / (num_batches - 1)
+    t_critical = T_CRITICAL_95.get(num_batches - 1, 1.96)
+    return t_critical * math.sqrt(variance / num_batches) / abs(mean)
+
+
+class SteadyStateDetector(object):
+    """
+    Online steady-state detection on the ACK rate, RTT and cwnd streams of a strategy.
+
+    The strategy's counters are snapshotted every `interval` seconds and each
+    stream is reduced to one value per interval. The warm-up is the latest MSER-5
+    truncation point over the three streams; the run may stop once the remaining
+    steady-state part covers `min_steady_time` and the batch-means CI of every
+    stream is within `rel_precision` of its mean.
+    """
+    def __init__(self, interval=0.5, rel_precision=0.05, min_steady_time=10.0, num_batches=10) -> None:
+        self.interval = interval
+        self.rel_precision = rel_precision
+        self.min_steady_time = min_steady_time
+        self.num_batches = num_batches
+
+        self.start_time: Optional[float] = None
+        self.last_check: Optional[float] = None
+        self.snapshots: List[Dict] = []  # counters at the end of every interval
+        self.streams: Dict[str, List[float]] = {'ack_rate': [], 'rtt': [], 'cwnd': []}
+        self.warmup_intervals = 0
+        self.converged = False
+        self.end_time: Optional[float] = None
+
+    def snapshot(self, strategy, now: float) -> Dict:
+        return {
+            'time': now,
+            'ack_index': strategy.ack_count,
+            'rtt_index': len(strategy.rtts),
+            'cwnd_index': len(strategy.cwnds),
+            'total_acks': strategy.total_acks,
+            'dup_acks': getattr(strategy, 'num_duplicate_acks', 0),
+            'sequential_acks': getattr(strategy, 'sequential_ack_count', 0),
+            'ce_count': strategy.ce_count,
+            'ecn_reductions': strategy.ecn_reductions,
+            'timeouts': strategy.timeouts,
+        }
+
+    def start(self, strategy, now: float) -> None:
+        self.start_time = self.last_check = now
+        self.snapshots = [self.snapshot(strategy, now)]
+
+    def record_interval(self, strategy, now: float) -> None:
+        prev = self.snapshots[-1]
+        curr = self.snapshot(strategy, now)
+        self.snapshots.append(curr)
+
+        rtts = strategy.rtts[prev['rtt_index']:curr['rtt_index']]
+        cwnds = strategy.cwnds[prev['cwnd_index']:curr['cwnd_index']]
+        self.streams['ack_rate'].append((curr['ack_index'] - prev['ack_index']) / (now - prev['time']))
+        # Carry the last value forward over intervals without samples
+        self.streams['rtt'].append(sum(rtts) / len(rtts) if rtts else (self.streams['rtt'] or [0.0])[-1])
+        self.streams['cwnd'].append(sum(cwnds) / len(cwnds) if cwnds else float(getattr(strategy, 'cwnd', 0)))
+
+    def update(self, strategy, now: float) -> bool:
+        """Called from the sender loop; returns True once the run can stop."""
+        if now - self.last_check < self.interval:
+            return False
+        self.last_check = now
+        self.record_interval(strategy, now)
+        self.end_time = now
+
+        self.warmup_intervals = max(mser_truncation(stream) for stream in self.streams.values())
+        steady_intervals = len(self.streams['rtt']) - self.warmup_intervals
+        if steady_intervals * self.interval < self.min_steady_time:
+            return False
+
+        self.converged = all(
+            batch_means_precision(stream[self.warmup_intervals:], self.num_batches) <= self.rel_precision
+            for stream in self.streams.values())
+        return self.converged
+
+    def summary(self) -> Optional[Dict]:
+        """
+        Counters at the end of the warm-up ('start') and at the last snapshot
+        ('end', taken at end_time), or None if no interval was recorded.
+        """
+        if len(self.snapshots) < 2:
+            return None
+        warmup, end = self.snapshots[self.warmup_intervals], self.snapshots[-1]
+        return {
+            'warmup_time': warmup['time'] - self.start_time,
+            'steady_time': end['time'] - warmup['time'],
+            'start': warmup,
+            'end': end,
+            'converged': self.converged,
+        }
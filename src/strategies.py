@@ -1,7 +1,14 @@
 import json
+import math
 import time
 import random
+from collections import deque
 from typing import Dict, List, Optional, Tuple
+from src.timers import TimerWheel, TICK
+
+INITIAL_RTO = 1.0  # s, RFC 6298
+MIN_RTO = 0.2  # s, Linux's floor rather than RFC 6298's conservative 1 s
+MAX_RTO = 60.0  # s
 
 class SenderStrategy(object):
     def __init__(self) -> None:
@@ -21,12 +28,197 @@ class SenderStrategy(object):
         self.time_of_retransmit: Optional[float] = None
         self.total_sent_packets = 0
 
+        # ECN: the receiver echoes a cumulative count of CE-marked segments in every ACK
+        self.ce_count = 0
+        self.ecn_reductions = 0
+        self.ecn_recovery_end = 0  # no further ECN reduction until this seq_num is acked
+
+        # RFC 6298 retransmission timeout, with one timer per segment in flight
+        self.srtt: Optional[float] = None
+        self.rttvar: Optional[float] = None
+        self.rto = INITIAL_RTO
+        self.timers: Optional[TimerWheel] = None  # created on the first send unless a shared one is attached
+        self.timer_owner = None  # with a shared wheel, keys are (timer_owner, seq_num)
+        self.highest_sent = -1
+        self.retransmitted = set()  # resent segments in flight, no RTT samples from them (Karn)
+        self.timeouts = 0
+
+        # Startup: when slow start first ended, and duplicate ACKs for segments sent before that
+        self.startup_end: Optional[float] = None
+        self.startup_seq: Optional[int] = None
+        self.startup_dup_acks = 0
+
     def next_packet_to_send(self):
         raise NotImplementedError
 
     def process_ack(self, ack: str):
         raise NotImplementedError
 
+    def process_acks(self, batch: List[str]) -> None:
+        """Process every ACK drained in one wakeup; strategies may override it to share work."""
+        for ack in batch:
+            self.process_ack(ack)
+
+    def process_ecn(self, ack: Dict) -> int:
+        """Account the CE marks newly echoed by a parsed ACK and react to them; returns their number."""
+        marks = max(0, ack.get('ce_count', 0) - self.ce_count)
+        self.ce_count += marks
+        self.on_ecn_echo(ack, marks)
+        return marks
+
+    def on_ecn_echo(self, ack: Dict, marks: int) -> None:
+        """Classic ECN (RFC 3168): reduce the window at most once per RTT while marks arrive."""
+        if marks and ack['seq_num'] >= self.ecn_recovery_end:
+            self.ecn_recovery_end = self.seq_num
+            self.ecn_reductions += 1
+            self.reduce_window()
+
+    def reduce_window(self) -> None:
+        """Multiplicative decrease on congestion; strategies with a window override it."""
+        pass
+
+    def window_is_open(self) -> bool:
+        return True
+
+    def next_event_time(self) -> Optional[float]:
+        """
+        When the strategy cannot send right away, the earliest time it needs the
+        sender loop back (a paced send or a retransmission timeout); None to
+        send whenever the socket is writable.
+        """
+        return None if self.window_is_open() else self.next_timeout()
+
+    def next_timeout(self) -> Optional[float]:
+        return self.timers.next_deadline() if self.timers is not None else None
+
+    def attach_timers(self, timers: TimerWheel, owner) -> None:
+        """Keep this strategy's timers in a wheel shared with others, which then expires them."""
+        self.timers = timers
+        self.timer_owner = owner
+
+    def timer_key(self, seq_num: int):
+        return seq_num if self.timer_owner is None else (self.timer_owner, seq_num)
+
+    def on_packet_sent(self, seq_num: int, now: float) -> None:
+        """Arm the retransmission timer of a segment that was just sent."""
+        if self.timers is None:
+            self.timers = TimerWheel(self.start_time)
+        if seq_num <= self.highest_sent:
+            self.retransmitted.add(seq_num)
+        self.highest_sent = max(self.highest_sent, seq_num)
+        self.timers.schedule(self.timer_key(seq_num), now + self.rto)
+
+    def acknowledge(self, first: int, last: int) -> None:
+        """Forget segments first..last (cumulatively acked) and cancel their timers."""
+        for seq_num in range(first, last + 1):
+            self.unacknowledged_packets.pop(seq_num, None)
+            if self.timers is not None:
+                self.timers.cancel(self.timer_key(seq_num))
+            self.retransmitted.discard(seq_num)
+        # Segments received before a go-back-N may be acked past what was resent
+        self.seq_num = max(self.seq_num, last + 1)
+
+    def update_rto(self, seq_num: int, rtt: float) -> None:
+        """RFC 6298 estimator; by Karn's rule retransmitted segments give no sample."""
+        if seq_num in self.retransmitted:
+            return
+        if self.srtt is None:
+            self.srtt, self.rttvar = rtt, rtt / 2
+        else:
+            self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - rtt)
+            self.srtt = 0.875 * self.srtt + 0.125 * rtt
+        self.rto = min(max(self.srtt + max(TICK, 4 * self.rttvar), MIN_RTO), MAX_RTO)
+
+    def check_timeouts(self, now: float) -> bool:
+        """Expire retransmission timers; True if one fired."""
+        if self.timers is None or not self.timers.advance(now):
+            return False
+        self.retransmission_timeout(now)
+        return True
+
+    def retransmission_timeout(self, now: float) -> None:
+        """
+        Back the RTO off, resend everything from the first unacknowledged
+        segment (go-back-N) and let the strategy shrink its window.
+        """
+        flight_size = self.seq_num - self.next_ack
+        self.timeouts += 1
+        self.rto = min(self.rto * 2, MAX_RTO)
+        for seq_num in range(self.next_ack, self.highest_sent + 1):
+            self.timers.cancel(self.timer_key(seq_num))
+        self.seq_num = self.next_ack
+        self.curr_duplicate_acks = 0
+        self.time_of_retransmit = now
+        self.on_timeout(flight_size)
+
+    def on_timeout(self, flight_size: int) -> None:
+        """Window reaction to a retransmission timeout; strategies with a window override it."""
+        pass
+
+    def in_slow_start(self) -> bool:
+        return self.cwnd < self.slow_start_thresh
+
+    def track_startup(self, ack_seq: int, duplicate: bool, now: float) -> None:
+        if duplicate and (self.startup_end is None or ack_seq < self.startup_seq):
+            self.startup_dup_acks += 1
+        if self.startup_end is None and not self.in_slow_start():
+            self.startup_end = now - self.start_time
+            self.startup_seq = self.seq_num
+
+
+class HyStartPlusPlus(object):
+    """
+    HyStart++ (RFC 9406): leave slow start when the minimum RTT of a round rises
+    by a clamped eighth of the previous round's, through CSS_ROUNDS rounds of
+    Conservative Slow Start that grow the window four times slower. CSS falls
+    back to slow start if the RTT increase turns out to be spurious.
+    """
+    MIN_RTT_THRESH = 0.004  # s
+    MAX_RTT_THRESH = 0.016  # s
+    MIN_RTT_DIVISOR = 8
+    N_RTT_SAMPLE = 8
+    CSS_GROWTH_DIVISOR = 4
+    CSS_ROUNDS = 5
+
+    def __init__(self) -> None:
+        self.window_end = 0  # a round ends once this seq_num is acked
+        self.last_round_min_rtt = float('inf')
+        self.current_round_min_rtt = float('inf')
+        self.rtt_sample_count = 0
+        self.css_baseline_min_rtt = float('inf')
+        self.css_rounds = 0
+        self.in_css = False
+        self.done = False  # slow start is over (or a loss ended it)
+
+    def on_ack(self, ack_seq: int, rtt: float, snd_nxt: int) -> float:
+        """Update with a new ACK during slow start; returns the cwnd increase for it."""
+        if ack_seq >= self.window_end:
+            self.window_end = snd_nxt
+            self.last_round_min_rtt = self.current_round_min_rtt
+            self.current_round_min_rtt = float('inf')
+            self.rtt_sample_count = 0
+            if self.in_css:
+                self.css_rounds += 1
+
+        self.current_round_min_rtt = min(self.current_round_min_rtt, rtt)
+        self.rtt_sample_count += 1
+
+        if self.in_css:
+            if self.css_rounds >= self.CSS_ROUNDS:
+                self.done = True
+            elif self.rtt_sample_count >= self.N_RTT_SAMPLE and self.current_round_min_rtt < self.css_baseline_min_rtt:
+                # Spurious exit, resume slow start
+                self.in_css = False
+                self.css_baseline_min_rtt = float('inf')
+        elif self.rtt_sample_count >= self.N_RTT_SAMPLE and self.last_round_min_rtt != float('inf'):
+            rtt_thresh = min(max(self.last_round_min_rtt / self.MIN_RTT_DIVISOR, self.MIN_RTT_THRESH), self.MAX_RTT_THRESH)
+            if self.current_round_min_rtt >= self.last_round_min_rtt + rtt_thresh:
+                self.in_css = True
+                self.css_baseline_min_rtt = self.current_round_min_rtt
+                self.css_rounds = 0
+
+        return 1 / self.CSS_GROWTH_DIVISOR if self.in_css else 1
+
 class PoissonPacketStrategy(SenderStrategy):
     def __init__(self, cwnd: int, rate_lambda: float) -> None:
         super().__init__()
@@ -94,8 +286,9 @@ class PoissonPacketStrategy(SenderStrategy):
 
 
 class RenoStrategy(SenderStrategy):
-    def __init__(self, slow_start_thresh: int, initial_cwnd: int, rate_lambda: float, seed: int) -> None:
+    def __init__(self, slow_start_thresh: int, initial_cwnd: int, rate_lambda: float, seed: int, hystart=False) -> None:
         self.slow_start_thresh = slow_start_thresh
+        self.hystart = HyStartPlusPlus() if hystart else None
         self.cwnd = initial_cwnd
         self.rate_lambda = rate_lambda
         self.sequential_ack_count = 0  # Sequential ACK counter
@@ -130,18 +323,42 @@ class RenoStrategy(SenderStrategy):
             'send_ts': current_time
         }
         self.unacknowledged_packets[self.seq_num] = send_data
+        self.on_packet_sent(self.seq_num, current_time)
         self.seq_num += 1
         return json.dumps(send_data)
 
+    def reduce_window(self) -> None:
+        self.slow_start_thresh = max(1, self.cwnd // 2)  # Halve cwnd
+        self.cwnd = self.slow_start_thresh  # Enter congestion avoidance
+        if self.hystart:
+            self.hystart.done = True
+
+    def on_timeout(self, flight_size: int) -> None:
+        # RFC 5681: restart from a loss window of one segment
+        self.slow_start_thresh = max(2, flight_size // 2)
+        self.cwnd = 1
+        if self.hystart:
+            self.hystart.done = True
+
     def process_ack(self, serialized_ack: str) -> None:
-        ack = json.loads(serialized_ack)
+        self.on_ack(json.loads(serialized_ack), time.time())
+
+    def process_acks(self, batch: List[str]) -> None:
+        """Same as process_ack for each ACK, with one clock read for the whole batch."""
+        now = time.time()
+        for serialized_ack in batch:
+            self.on_ack(json.loads(serialized_ack), now)
+
+    def on_ack(self, ack: Dict, now: float) -> None:
         if ack.get('handshake'):
             return
 
         self.total_acks += 1
-        self.times_of_acknowledgements.append(((time.time() - self.start_time), ack['seq_num']))
+        self.times_of_acknowledgements.append(((now - self.start_time), ack['seq_num']))
+        self.process_ecn(ack)
 
-        if self.unacknowledged_packets.get(ack['seq_num']) is None:
+        duplicate = self.unacknowledged_packets.get(ack['seq_num']) is None
+        if duplicate:
             # Duplicate ACK received
             self.num_duplicate_acks += 1
             if self.duplicated_ack and ack['seq_num'] == self.duplicated_ack['seq_num']:
@@ -152,20 +369,17 @@ class RenoStrategy(SenderStrategy):
 
             if self.curr_duplicate_acks == 3:
                 # Fast retransmit
-                self.slow_start_thresh = max(1, self.cwnd // 2)  # Halve cwnd
-                self.cwnd = self.slow_start_thresh  # Enter congestion avoidance
+                self.reduce_window()
                 self.num_duplicate_acks = 0
                 self.retransmitting_packet = True
         elif ack['seq_num'] >= self.next_ack:
             # Successful ACK, move window
-            self.unacknowledged_packets = {
-                k: v for k, v in self.unacknowledged_packets.items()
-                if k > ack['seq_num']
-            }
+            rtt = float(now - ack['send_ts'])
+            self.update_rto(ack['seq_num'], rtt)
+            self.acknowledge(self.next_ack, ack['seq_num'])
             self.next_ack = max(self.next_ack, ack['seq_num'] + 1)
             self.ack_count += 1
             self.sent_bytes += ack['ack_bytes']
-            rtt = float(time.time() - ack['send_ts'])
             self.rtts.append(rtt)
 
             # Count sequential ACKs
@@ -174,11 +388,17 @@ class RenoStrategy(SenderStrategy):
 
             if self.cwnd < self.slow_start_thresh:
                 # In slow start
-                self.cwnd += 1
+                if self.hystart and not self.hystart.done:
+                    self.cwnd += self.hystart.on_ack(ack['seq_num'], rtt, self.seq_num)
+                    if self.hystart.done:
+                        self.slow_start_thresh = self.cwnd  # HyStart++ exit to congestion avoidance
+                else:
+                    self.cwnd += 1
             else:
                 # Additive increase in congestion avoidance
                 self.cwnd += 1.0 / self.cwnd
 
+        self.track_startup(ack['seq_num'], duplicate, now)
         self.cwnds.append(self.cwnd)
         self.slow_start_thresholds.append(self.slow_start_thresh)
 
@@ -189,8 +409,9 @@ class RenoStrategy(SenderStrategy):
 
 
 class CubicStrategy(SenderStrategy):
-    def __init__(self, slow_start_thresh: int, initial_cwnd: int, rate_lambda: float, seed: int) -> None:
+    def __init__(self, slow_start_thresh: int, initial_cwnd: int, rate_lambda: float, seed: int, hystart=False) -> None:
         self.slow_start_thresh = slow_start_thresh
+        self.hystart = HyStartPlusPlus() if hystart else None
         self.cwnd = initial_cwnd
         self.rate_lambda = rate_lambda
         self.sequential_ack_count = 0  # Sequential ACK counter
@@ -209,14 +430,18 @@ class CubicStrategy(SenderStrategy):
         # Smoothed RTT
         self.smoothed_rtt = None
 
+        # Last cubic_window_growth evaluation, keyed by (clock, t_start, cwnd_max)
+        self.growth_key = None
+        self.growth = initial_cwnd
+
         super().__init__()
 
     def window_is_open(self) -> bool:
         return self.seq_num - self.next_ack < self.cwnd
 
-    def cubic_window_growth(self) -> float:
+    def cubic_window_growth(self, now: Optional[float] = None) -> float:
         # Time elapsed since the last congestion event
-        t = time.time() - self.t_start
+        t = (now if now is not None else time.time()) - self.t_start
         K = (self.cwnd_max / self.C) ** (1 / 3)  # Calculate K
         cwnd = self.C * (t - K) ** 3 + self.cwnd_max  # Cubic growth
         return max(1, cwnd)
@@ -239,18 +464,46 @@ class CubicStrategy(SenderStrategy):
             'send_ts': current_time
         }
         self.unacknowledged_packets[self.seq_num] = send_data
+        self.on_packet_sent(self.seq_num, current_time)
         self.seq_num += 1
         return json.dumps(send_data)
 
+    def reduce_window(self) -> None:
+        self.slow_start_thresh = max(1, self.cwnd // 2)
+        # self.cwnd = self.slow_start_thresh
+        self.cwnd = max(self.slow_start_thresh, self.cwnd * 0.7)  # Limit reduction
+        self.cwnd_max = self.cwnd  # Update cubic parameters
+        self.t_start = time.time()  # Reset cubic timer
+        if self.hystart:
+            self.hystart.done = True
+
+    def on_timeout(self, flight_size: int) -> None:
+        self.cwnd_max = self.cwnd
+        self.slow_start_thresh = max(2, flight_size // 2)
+        self.cwnd = 1
+        self.t_start = time.time()
+        if self.hystart:
+            self.hystart.done = True
+
     def process_ack(self, serialized_ack: str) -> None:
-        ack = json.loads(serialized_ack)
+        self.on_ack(json.loads(serialized_ack), time.time())
+
+    def process_acks(self, batch: List[str]) -> None:
+        """Same as process_ack for each ACK, with one clock read for the whole batch."""
+        now = time.time()
+        for serialized_ack in batch:
+            self.on_ack(json.loads(serialized_ack), now)
+
+    def on_ack(self, ack: Dict, now: float) -> None:
         if ack.get('handshake'):
             return
 
         self.total_acks += 1
-        self.times_of_acknowledgements.append(((time.time() - self.start_time), ack['seq_num']))
+        self.times_of_acknowledgements.append(((now - self.start_time), ack['seq_num']))
+        self.process_ecn(ack)
 
-        if self.unacknowledged_packets.get(ack['seq_num']) is None:
+        duplicate = self.unacknowledged_packets.get(ack['seq_num']) is None
+        if duplicate:
             # Duplicate ACK handling
             if self.last_ack_seq == ack['seq_num']:
                 self.curr_duplicate_acks += 1
@@ -260,22 +513,16 @@ class CubicStrategy(SenderStrategy):
 
             # Trigger fast retransmit on 3 duplicate ACKs
             if self.curr_duplicate_acks == 3:
-                self.slow_start_thresh = max(1, self.cwnd // 2)
-                # self.cwnd = self.slow_start_thresh
-                self.cwnd = max(self.slow_start_thresh, self.cwnd * 0.7)  # Limit reduction
-                self.cwnd_max = self.cwnd  # Update cubic parameters
-                self.t_start = time.time()  # Reset cubic timer
+                self.reduce_window()
                 self.num_duplicate_acks += 1  # Increment total duplicate ACK counter
         elif ack['seq_num'] >= self.next_ack:
             # Successful ACK, move window
-            self.unacknowledged_packets = {
-                k: v for k, v in self.unacknowledged_packets.items()
-                if k > ack['seq_num']
-            }
+            rtt = float(now - ack['send_ts'])
+            self.update_rto(ack['seq_num'], rtt)
+            self.acknowledge(self.next_ack, ack['seq_num'])
             self.next_ack = max(self.next_ack, ack['seq_num'] + 1)
             self.ack_count += 1
             self.sent_bytes += ack['ack_bytes']
-            rtt = float(time.time() - ack['send_ts'])
             self.rtts.append(rtt)
 
             # Update smoothed RTT
@@ -289,15 +536,319 @@ class CubicStrategy(SenderStrategy):
 
             if self.cwnd < self.slow_start_thresh:
                 # In slow start
-                self.cwnd += 1
+                if self.hystart and not self.hystart.done:
+                    self.cwnd += self.hystart.on_ack(ack['seq_num'], rtt, self.seq_num)
+                    if self.hystart.done:
+                        self.slow_start_thresh = self.cwnd  # HyStart++ exit to congestion avoidance
+                else:
+                    self.cwnd += 1
             else:
-                # In congestion avoidance, cubic growth
-                self.cwnd = self.cubic_window_growth()
-
+                # In congestion avoidance, cubic growth; the curve only depends on time,
+                # so ACKs of one batch share a single evaluation
+                key = (now, self.t_start, self.cwnd_max)
+                if key != self.growth_key:
+                    self.growth_key, self.growth = key, self.cubic_window_growth(now)
+                self.cwnd = self.growth
+
+        self.track_startup(ack['seq_num'], duplicate, now)
         self.cwnds.append(self.cwnd)
         self.slow_start_thresholds.append(self.slow_start_thresh)
     
     def sequential_ack_ratio(self) -> float:
         if self.total_acks == 0:
             return 0.0
-        return self.sequential_ack_count / self.total_acks
\ No newline at end of file
+        return self.sequential_ack_count / self.total_acks
+
+
+class DctcpStrategy(RenoStrategy):
+    """
+    DCTCP (RFC 8257): Reno, except that CE marks shrink the window in proportion
+    to the fraction of marked segments, estimated once per window of data.
+    """
+    def __init__(self, slow_start_thresh: int, initial_cwnd: int, rate_lambda: float, seed: int, hystart=False,
+                 g=1 / 16) -> None:
+        super().__init__(slow_start_thresh, initial_cwnd, rate_lambda, seed, hystart)
+        self.g = g  # EWMA gain of the marked fraction
+        self.alpha = 1.0
+        self.alphas: List[float] = []
+        self.window_end = 0
+        self.window_acked = 0
+        self.window_marked = 0
+
+    def on_ecn_echo(self, ack: Dict, marks: int) -> None:
+        self.window_acked += 1
+        self.window_marked += marks
+        if ack['seq_num'] < self.window_end:
+            return
+
+        # One window of data acknowledged: update alpha and react once if it carried marks
+        fraction = min(1.0, self.window_marked / self.window_acked)
+        self.alpha = (1 - self.g) * self.alpha + self.g * fraction
+        self.alphas.append(self.alpha)
+        if self.window_marked:
+            self.ecn_reductions += 1
+            self.cwnd = max(1, self.cwnd * (1 - self.alpha / 2))
+            self.slow_start_thresh = self.cwnd
+        self.window_end = self.seq_num
+        self.window_acked = 0
+        self.window_marked = 0
+
+
+class BbrStrategy(SenderStrategy):
+    """
+    Model-based control after BBR v1: per-packet delivery-rate samples feed a
+    windowed max bandwidth filter (10 rounds) and a min RTT filter (10 s), and
+    the STARTUP, DRAIN, PROBE_BW and PROBE_RTT states set the pacing rate and a
+    cwnd of a few BDPs from them. Losses do not shrink the window; 3 duplicate
+    ACKs resend everything from the first unacknowledged segment (go-back-N).
+    rate_lambda is the pacing rate until the first delivery-rate sample.
+    """
+    STARTUP = 'startup'
+    DRAIN = 'drain'
+    PROBE_BW = 'probe_bw'
+    PROBE_RTT = 'probe_rtt'
+
+    HIGH_GAIN = 2 / math.log(2)
+    DRAIN_GAIN = math.log(2) / 2
+    PACING_GAIN_CYCLE = [1.25, 0.75, 1, 1, 1, 1, 1, 1]
+    CWND_GAIN = 2.0
+    BW_WINDOW_ROUNDS = 10
+    MIN_RTT_WINDOW = 10.0  # s
+    PROBE_RTT_DURATION = 0.2  # s
+    MIN_CWND = 4
+    PACING_SLACK = 0.001  # s of missed send slots that may still go out back to back
+
+    def __init__(self, initial_cwnd: int, rate_lambda: float, seed: int) -> None:
+        super().__init__()
+        now = self.start_time
+        self.cwnd = initial_cwnd
+        self.slow_start_thresh = float('inf')
+        self.rate_lambda = rate_lambda
+        self.pacing_rate = rate_lambda  # packets/s
+        self.next_send_time = 0.0
+        self.sequential_ack_count = 0
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.recovery_point = -1  # highest seq sent when the last go-back-N fired, no new one until it is acked
+
+        # Delivery-rate sampling
+        self.delivered = 0
+        self.delivered_time = now
+        self.first_sent_time = now
+
+        # Round trips and filters
+        self.round_count = 0
+        self.next_round_delivered = 0
+        self.round_start = False
+        self.bw_filter = deque()  # (round, bw), decreasing bw: the max is at the front
+        self.btl_bw = 0.0
+        self.min_rtt = float('inf')
+        self.min_rtt_stamp = now
+
+        # State machine
+        self.state = self.STARTUP
+        self.pacing_gain = self.HIGH_GAIN
+        self.cwnd_gain = self.HIGH_GAIN
+        self.full_bw = 0.0
+        self.full_bw_count = 0
+        self.filled_pipe = False
+        self.cycle_index = 0
+        self.cycle_stamp = now
+        self.probe_rtt_done_stamp: Optional[float] = None
+        self.probe_rtt_round_done = False
+        self.prior_cwnd = initial_cwnd
+        self.states: List[Tuple[float, str]] = [(0.0, self.STARTUP)]
+
+    def window_is_open(self) -> bool:
+        return self.seq_num - self.next_ack < self.cwnd
+
+    def inflight(self) -> int:
+        return self.seq_num - self.next_ack
+
+    def bdp(self) -> float:
+        return self.btl_bw * self.min_rtt
+
+    def in_slow_start(self) -> bool:
+        return self.state == self.STARTUP
+
+    def next_event_time(self) -> Optional[float]:
+        return self.next_send_time if self.window_is_open() else self.next_timeout()
+
+    def on_timeout(self, flight_size: int) -> None:
+        self.cwnd = 1  # grows back to the model's target as ACKs arrive
+
+    def next_packet_to_send(self) -> Optional[str]:
+        current_time = time.time()
+        if current_time < self.next_send_time or not self.window_is_open():
+            return None
+
+        if self.inflight() == 0:
+            # Restarting from idle: do not count the idle time as delivery time
+            self.first_sent_time = self.delivered_time = current_time
+        send_data = {
+            'seq_num': self.seq_num,
+            'send_ts': current_time
+        }
+        # Delivery-rate state at send time (delivered, delivered_time, first_sent_time, sent_time)
+        self.unacknowledged_packets[self.seq_num] = (self.delivered, self.delivered_time, self.first_sent_time, current_time)
+        self.on_packet_sent(self.seq_num, current_time)
+        self.seq_num += 1
+        self.total_sent_packets += 1
+        self.next_send_time = max(self.next_send_time, current_time - self.PACING_SLACK) + 1 / self.pacing_rate
+        return json.dumps(send_data)
+
+    def process_ack(self, serialized_ack: str) -> None:
+        self.on_ack(json.loads(serialized_ack), time.time())
+
+    def process_acks(self, batch: List[str]) -> None:
+        now = time.time()
+        for serialized_ack in batch:
+            self.on_ack(json.loads(serialized_ack), now)
+
+    def on_ack(self, ack: Dict, now: float) -> None:
+        if ack.get('handshake'):
+            return
+
+        self.total_acks += 1
+        self.times_of_acknowledgements.append(((now - self.start_time), ack['seq_num']))
+        self.process_ecn(ack)
+
+        seq_num = ack['seq_num']
+        duplicate = seq_num < self.next_ack
+        if duplicate:
+            # The cumulative ACK did not advance
+            self.num_duplicate_acks += 1
+            # Duplicates of a loss that was already resent do not count towards another go-back-N
+            if self.next_ack > self.recovery_point:
+                self.curr_duplicate_acks += 1
+            if self.curr_duplicate_acks == 3:
+                # Go-back-N from the first unacknowledged segment, once per loss event
+                self.curr_duplicate_acks = 0
+                self.recovery_point = self.highest_sent
+                self.seq_num = self.next_ack
+                self.time_of_retransmit = now
+        else:
+            self.curr_duplicate_acks = 0
+            packet = self.unacknowledged_packets.get(seq_num)
+            newly_acked = seq_num + 1 - self.next_ack
+            rtt = float(now - ack['send_ts'])
+            self.update_rto(seq_num, rtt)
+            self.acknowledge(self.next_ack, seq_num)
+            if newly_acked == 1:
+                self.sequential_ack_count += 1
+            self.next_ack = seq_num + 1
+            self.delivered += newly_acked
+            self.delivered_time = now
+            self.ack_count += 1
+            self.sent_bytes += ack['ack_bytes']
+            self.rtts.append(rtt)
+            if packet is not None:
+                self.update_model(packet, rtt, now)
+            self.set_cwnd(newly_acked)
+
+        self.track_startup(seq_num, duplicate, now)
+        self.cwnds.append(self.cwnd)
+
+    def update_model(self, packet: Tuple, rtt: float, now: float) -> None:
+        p_delivered, p_delivered_time, p_first_sent_time, p_sent_time = packet
+        self.first_sent_time = p_sent_time
+
+        # Round trip counting
+        self.round_start = p_delivered >= self.next_round_delivered
+        if self.round_start:
+            self.next_round_delivered = self.delivered
+            self.round_count += 1
+
+        # Delivery rate sample, max-filtered over the last BW_WINDOW_ROUNDS rounds
+        interval = max(p_sent_time - p_first_sent_time, now - p_delivered_time)
+        if interval > 0:
+            bw = (self.delivered - p_delivered) / interval
+            while self.bw_filter and self.bw_filter[-1][1] <= bw:
+                self.bw_filter.pop()
+            self.bw_filter.append((self.round_count, bw))
+        while self.bw_filter and self.bw_filter[0][0] <= self.round_count - self.BW_WINDOW_ROUNDS:
+            self.bw_filter.popleft()
+        self.btl_bw = self.bw_filter[0][1] if self.bw_filter else 0.0
+
+        self.update_state(rtt, now)
+        if self.btl_bw > 0:
+            rate = self.pacing_gain * self.btl_bw
+            if self.filled_pipe or rate > self.pacing_rate:
+                self.pacing_rate = rate
+
+    def enter(self, state: str, now: float) -> None:
+        self.state = state
+        self.states.append((now - self.start_time, state))
+        if state == self.STARTUP:
+            self.pacing_gain, self.cwnd_gain = self.HIGH_GAIN, self.HIGH_GAIN
+        elif state == self.DRAIN:
+            self.pacing_gain, self.cwnd_gain = self.DRAIN_GAIN, self.HIGH_GAIN
+        elif state == self.PROBE_BW:
+            # Start at a random phase other than the drain phase (0.75)
+            self.cycle_index = self.rng.choice([i for i in range(len(self.PACING_GAIN_CYCLE)) if i != 1])
+            self.cycle_stamp = now
+            self.pacing_gain, self.cwnd_gain = self.PACING_GAIN_CYCLE[self.cycle_index], self.CWND_GAIN
+        elif state == self.PROBE_RTT:
+            self.pacing_gain, self.cwnd_gain = 1.0, 1.0
+            self.prior_cwnd = self.cwnd
+            self.probe_rtt_done_stamp = None
+
+    def update_state(self, rtt: float, now: float) -> None:
+        # Full pipe: bandwidth grew less than 25% for 3 rounds
+        if not self.filled_pipe and self.round_start:
+            if self.btl_bw >= self.full_bw * 1.25:
+                self.full_bw, self.full_bw_count = self.btl_bw, 0
+            else:
+                self.full_bw_count += 1
+                self.filled_pipe = self.full_bw_count >= 3
+
+        if self.state == self.STARTUP and self.filled_pipe:
+            self.enter(self.DRAIN, now)
+        if self.state == self.DRAIN and self.inflight() <= self.bdp():
+            self.enter(self.PROBE_BW, now)
+
+        if self.state == self.PROBE_BW:
+            gain = self.PACING_GAIN_CYCLE[self.cycle_index]
+            elapsed = now - self.cycle_stamp > self.min_rtt
+            if elapsed or (gain < 1 and self.inflight() <= self.bdp()):
+                self.cycle_index = (self.cycle_index + 1) % len(self.PACING_GAIN_CYCLE)
+                self.cycle_stamp = now
+                self.pacing_gain = self.PACING_GAIN_CYCLE[self.cycle_index]
+
+        # Min RTT filter; once it expires, drain the queue to measure a fresh one
+        expired = now - self.min_rtt_stamp > self.MIN_RTT_WINDOW
+        if rtt <= self.min_rtt or expired:
+            self.min_rtt, self.min_rtt_stamp = rtt, now
+        if expired and self.state != self.PROBE_RTT:
+            self.enter(self.PROBE_RTT, now)
+
+        if self.state == self.PROBE_RTT:
+            if self.probe_rtt_done_stamp is None and self.inflight() <= self.MIN_CWND:
+                self.probe_rtt_done_stamp = now + self.PROBE_RTT_DURATION
+                self.probe_rtt_round_done = False
+                self.next_round_delivered = self.delivered
+            elif self.probe_rtt_done_stamp is not None:
+                if self.round_start:
+                    self.probe_rtt_round_done = True
+                if self.probe_rtt_round_done and now > self.probe_rtt_done_stamp:
+                    self.min_rtt_stamp = now
+                    self.cwnd = max(self.cwnd, self.prior_cwnd)
+                    self.enter(self.PROBE_BW if self.filled_pipe else self.STARTUP, now)
+
+    def set_cwnd(self, newly_acked: int) -> None:
+        if self.btl_bw > 0 and self.min_rtt != float('inf'):
+            target = self.cwnd_gain * self.bdp()
+            if self.filled_pipe:
+                self.cwnd = min(self.cwnd + newly_acked, target)
+            elif self.cwnd < target:
+                self.cwnd += newly_acked
+        else:
+            self.cwnd += newly_acked
+        self.cwnd = max(self.cwnd, self.MIN_CWND)
+        if self.state == self.PROBE_RTT:
+            self.cwnd = min(self.cwnd, self.MIN_CWND)
+
+    def sequential_ack_ratio(self) -> float:
+        if self.total_acks == 0:
+            return 0.0
+        return self.sequential_ack_count / self.total_acks
@@ -0,0 +1,106 @@
+import math
+from typing import Dict, Hashable, List, Optional, Tuple
+
+TICK = 0.001  # s
+
+
+class TimerWheel(object):
+    """
+    Hierarchical timing wheel. Level 0 has `slots` buckets of one tick each and
+    every higher level's bucket spans a whole revolution of the level below;
+    timers cascade down a level each time the level below wraps. schedule() and
+    cancel() are O(1) (buckets are dicts keyed by the timer key), and advance()
+    costs O(1) per elapsed tick plus O(1) per expired or cascaded timer.
+    Deadlines are rounded up to the tick, so timers never fire early.
+    """
+    def __init__(self, origin: float, tick=TICK, slot_bits=8, levels=4) -> None:
+        self.origin = origin
+        self.tick = tick
+        self.slot_bits = slot_bits
+        self.mask = (1 << slot_bits) - 1
+        self.levels = levels
+        self.wheels: List[List[Dict[Hashable, int]]] = [[{} for _ in range(1 << slot_bits)] for _ in range(levels)]
+        self.timers: Dict[Hashable, Tuple[int, int]] = {}  # key -> (level, slot)
+        self.current = 0  # ticks since origin that have been processed
+
+    def __len__(self) -> int:
+        return len(self.timers)
+
+    def to_tick(self, t: float) -> int:
+        return math.ceil((t - self.origin) / self.tick)
+
+    def schedule(self, key: Hashable, deadline: float) -> None:
+        """Arm (or re-arm) the timer `key` to expire at `deadline`."""
+        if key in self.timers:
+            self.cancel(key)
+        self.insert(key, max(self.to_tick(deadline), self.current + 1))
+
+    def insert(self, key: Hashable, expiry: int) -> None:
+        delta = expiry - self.current
+        level = 0
+        while level < self.levels - 1 and delta >= 1 << (self.slot_bits * (level + 1)):
+            level += 1
+        slot_tick = expiry
+        if level == self.levels - 1:
+            # Beyond the top level's reach: park it in the furthest slot. The entry keeps
+            # its real expiry, so the cascade of that slot inserts it again from there
+            slot_tick = min(expiry, self.current + (self.mask << (self.slot_bits * level)))
+        slot = (slot_tick >> (self.slot_bits * level)) & self.mask
+        self.wheels[level][slot][key] = expiry
+        self.timers[key] = (level, slot)
+
+    def cancel(self, key: Hashable) -> bool:
+        location = self.timers.pop(key, None)
+        if location is None:
+            return False
+        level, slot = location
+        del self.wheels[level][slot][key]
+        return True
+
+    def clear(self) -> None:
+        for level, slot in self.timers.values():
+            self.wheels[level][slot].clear()
+        self.timers.clear()
+
+    def advance(self, now: float) -> List[Hashable]:
+        """Process every tick up to `now`; returns the keys of the timers that expired."""
+        target = math.floor((now - self.origin) / self.tick)
+        expired = []
+        if not self.timers:
+            self.current = max(self.current, target)
+            return expired
+
+        while self.current < target:
+            self.current += 1
+            # Cascade the higher levels whose bucket boundary was just crossed
+            for level in range(1, self.levels):
+                if self.current & ((1 << (self.slot_bits * level)) - 1):
+                    break
+                bucket = self.wheels[level][(self.current >> (self.slot_bits * level)) & self.mask]
+                for key, expiry in list(bucket.items()):
+                    del self.timers[key]
+                    self.insert(key, max(expiry, self.current))
+                bucket.clear()
+
+            bucket = self.wheels[0][self.current & self.mask]
+            if bucket:
+                for key in bucket:
+                    del self.timers[key]
+                expired.extend(bucket)
+                bucket.clear()
+            if not self.timers:
+                self.current = target
+        return expired
+
+    def next_deadline(self) -> Optional[float]:
+        """Earliest time a timer may expire (at least when the next cascade is due); None if none is armed."""
+        if not self.timers:
+            return None
+        level0 = self.wheels[0]
+        for i in range(1, self.mask + 1):
+            tick = self.current + i
+            if level0[tick & self.mask]:
+                return self.origin + tick * self.tick
+            if not tick & self.mask:
+                break  # the next level-1 bucket cascades here
+        return self.origin + tick * self.tick
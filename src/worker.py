@@ -0,0 +1,153 @@
+import os
+import json
+import signal
+import socket
+import subprocess
+from subprocess import Popen
+from typing import Dict, List, Optional
+from src.receiver import Receiver
+from src.sharded import ShardedReceiver
+from src.capture import CaptureLog
+
+READY_TIMEOUT = 30  # s, to start the emulator and the receiver interpreter
+STOP_TIMEOUT = 5  # s
+
+
+class ControlChannel(object):
+    """Newline-delimited JSON messages over a stream socket."""
+    def __init__(self, sock: socket.socket) -> None:
+        self.sock = sock
+        self.buffer = b''
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def send(self, msg: Dict) -> None:
+        self.sock.sendall(json.dumps(msg).encode() + b'\n')
+
+    def recv(self) -> Optional[Dict]:
+        """Block until a full message arrives; None once the peer has closed."""
+        while b'\n' not in self.buffer:
+            chunk = self.sock.recv(4096)
+            if not chunk:
+                return None
+            self.buffer += chunk
+        line, self.buffer = self.buffer.split(b'\n', 1)
+        return json.loads(line.decode())
+
+    def close(self) -> None:
+        self.sock.close()
+
+
+def stop_process_group(process: Popen, timeout=STOP_TIMEOUT) -> None:
+    """Terminate a process started with start_new_session=True and all of its children."""
+    try:
+        # The group can outlive its leader, so signal it even if the shell has exited
+        os.killpg(process.pid, signal.SIGTERM)
+        process.wait(timeout)
+    except subprocess.TimeoutExpired:
+        os.killpg(process.pid, signal.SIGKILL)
+        process.wait()
+    except ProcessLookupError:
+        process.wait()
+
+
+def serve(host: str, port: int, shards=1) -> None:
+    """
+    Receiver side of a ReceiverWorker: connect back to the control port and
+    serve runs until told to exit. Only imports the receiver, so start-up is cheap.
+    """
+    channel = ControlChannel(socket.create_connection((host, port)))
+    receiver = ShardedReceiver([], shards) if shards > 1 else Receiver([])
+    channel.send({'ready': True})
+
+    try:
+        while True:
+            msg = channel.recv()
+            if msg is None or msg.get('cmd') == 'exit':
+                break
+            if msg.get('cmd') != 'run':
+                continue
+
+            capture = CaptureLog(msg['capture']) if msg.get('capture') else None
+            receiver.reset([(host, p) for p in msg['peers']], capture, msg.get('ecn_threshold'))
+            channel.send({'ready': True, 'run': msg.get('run')})
+            receiver.perform_handshakes()
+            receiver.run(control=channel)
+            if capture:
+                capture.close()
+
+            # run() returns once the host has sent the stop command
+            msg = channel.recv()
+            channel.send({'done': True, 'run': msg.get('run') if msg else None, 'socket_drops': receiver.socket_drops()})
+            if msg is None or msg.get('cmd') == 'exit':
+                break
+    except KeyboardInterrupt:
+        pass
+    finally:
+        receiver.cleanup()
+        channel.close()
+
+
+class ReceiverWorker(object):
+    """
+    Long-lived receiver process (inside one mahimahi shell if mahimahi_cmd is
+    given) reused for every run with the same link settings.
+    """
+    def __init__(self, receiver_file: str, mahimahi_cmd: Optional[str] = None, link_log: Optional[str] = None,
+                 shards=1) -> None:
+        self.link_log = link_log  # mahimahi downlink log shared by all runs of this worker
+        self.mahimahi_settings: Optional[Dict] = None
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        listener.bind(('0.0.0.0', 0))
+        listener.listen(1)
+        control_port = listener.getsockname()[1]
+
+        shards_arg = f" --shards {shards}" if shards > 1 else ""
+        if mahimahi_cmd:
+            cmd = f"{mahimahi_cmd} -- sh -c 'python3 {receiver_file} --serve $MAHIMAHI_BASE {control_port}{shards_arg}'"
+        else:
+            cmd = f"python3 {receiver_file} --serve 127.0.0.1 {control_port}{shards_arg}"
+        self.process = Popen(cmd, shell=True, start_new_session=True)
+        self.runs = 0
+
+        listener.settimeout(READY_TIMEOUT)
+        try:
+            conn, _ = listener.accept()
+        except socket.timeout:
+            stop_process_group(self.process)
+            raise RuntimeError('Receiver worker did not connect to the control channel')
+        finally:
+            listener.close()
+        self.channel = ControlChannel(conn)
+        self.expect('ready')
+
+    def expect(self, key: str) -> Dict:
+        msg = self.channel.recv()
+        if msg is None or not msg.get(key):
+            raise RuntimeError(f'Receiver worker closed the control channel (waiting for {key})')
+        return msg
+
+    def start_run(self, ports: List[int], capture: Optional[str] = None, ecn_threshold: Optional[float] = None) -> None:
+        """Reset the receiver for new sender ports; returns once it is about to handshake."""
+        self.runs += 1
+        self.channel.send({'cmd': 'run', 'run': self.runs, 'peers': ports, 'capture': capture,
+                           'ecn_threshold': ecn_threshold})
+        self.expect('ready')
+
+    def stop_run(self) -> Dict:
+        self.channel.send({'cmd': 'stop', 'run': self.runs})
+        return self.expect('done')
+
+    def close(self) -> None:
+        try:
+            self.channel.send({'cmd': 'exit'})
+            self.process.wait(STOP_TIMEOUT)
+        except (OSError, subprocess.TimeoutExpired):
+            pass
+        stop_process_group(self.process)
+        self.channel.close()
+        if self.link_log and os.path.exists(self.link_log):
+            os.remove(self.link_log)
+
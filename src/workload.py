@@ -0,0 +1,212 @@
+import json
+import math
+import time
+import random
+import bisect
+from typing import Callable, Dict, List, Optional, Tuple
+from src.strategies import SenderStrategy
+from src.timers import TimerWheel
+
+# Flow size CDFs in segments (1460-byte MSS), as (size, cumulative probability).
+# Web search from the DCTCP paper, data mining from the VL2 paper (pFabric versions).
+WEB_SEARCH_CDF = [
+    (6, 0.0), (6, 0.15), (13, 0.2), (19, 0.3), (33, 0.4), (53, 0.53),
+    (133, 0.6), (667, 0.7), (1333, 0.8), (3333, 0.9), (6667, 0.97), (20000, 1.0)
+]
+DATA_MINING_CDF = [
+    (1, 0.0), (1, 0.5), (2, 0.6), (3, 0.7), (7, 0.8), (267, 0.9),
+    (2107, 0.95), (66667, 0.99), (666667, 1.0)
+]
+
+# FCT buckets in segments: (0, 100KB], (100KB, 10MB], (10MB, inf)
+FCT_BUCKETS = [
+    ('<100KB', 0, 68),
+    ('100KB-10MB', 68, 6849),
+    ('>10MB', 6849, float('inf')),
+]
+
+
+class FlowSizeDistribution(object):
+    def __init__(self, cdf: List[Tuple[int, float]]) -> None:
+        self.sizes = [float(size) for size, _ in cdf]
+        self.probs = [prob for _, prob in cdf]
+
+    def mean(self) -> float:
+        total = 0.0
+        for i in range(1, len(self.sizes)):
+            total += (self.probs[i] - self.probs[i-1]) * (self.sizes[i] + self.sizes[i-1]) / 2
+        return total
+
+    def sample(self, rng: random.Random) -> int:
+        """Inverse transform sampling with linear interpolation between CDF points."""
+        u = rng.random()
+        i = bisect.bisect_left(self.probs, u)
+        if i == 0:
+            return max(1, int(self.sizes[0]))
+        if i >= len(self.probs):
+            return max(1, int(self.sizes[-1]))
+        p0, p1 = self.probs[i-1], self.probs[i]
+        s0, s1 = self.sizes[i-1], self.sizes[i]
+        size = s0 if p1 == p0 else s0 + (s1 - s0) * (u - p0) / (p1 - p0)
+        return max(1, int(round(size)))
+
+
+def arrival_rate_for_load(load: float, link_pkts_per_sec: float, dist: FlowSizeDistribution) -> float:
+    """Flow arrival rate (flows/s) that offers `load` of the bottleneck capacity."""
+    return load * link_pkts_per_sec / dist.mean()
+
+
+def percentile(values: List[float], p: float) -> float:
+    """Nearest-rank percentile, p in [0, 100]."""
+    if not values:
+        return float('nan')
+    ordered = sorted(values)
+    rank = max(1, math.ceil(p / 100.0 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+class Flow(object):
+    def __init__(self, flow_id: int, size: int, strategy: SenderStrategy, start_time: float) -> None:
+        self.flow_id = flow_id
+        self.size = size
+        self.strategy = strategy
+        self.start_time = start_time
+        self.finish_time: Optional[float] = None
+
+    def has_data(self) -> bool:
+        return self.strategy.seq_num < self.size
+
+    def is_complete(self) -> bool:
+        return self.strategy.next_ack >= self.size
+
+
+class FlowWorkloadStrategy(SenderStrategy):
+    """
+    Multiplexes many short flows over one sender socket and one handshake.
+
+    Flows arrive by a Poisson process with sizes drawn from `size_dist`. Each flow
+    gets its own congestion controller from `strategy_factory(seed)` and its own
+    sequence space, tagged on the wire with `flow_id` so the receiver keeps a
+    separate window per flow and drops it once the flow is complete.
+    """
+    def __init__(self, strategy_factory: Callable[[int], SenderStrategy], size_dist: FlowSizeDistribution,
+                 arrival_rate: float, seed: Optional[int] = None, max_active_flows: int = 1000) -> None:
+        super().__init__()
+        self.strategy_factory = strategy_factory
+        self.size_dist = size_dist
+        self.arrival_rate = arrival_rate
+        self.max_active_flows = max_active_flows
+        self.rng = random.Random(seed)
+
+        self.next_flow_id = 0
+        self.next_arrival_time = self.start_time + self.rng.expovariate(self.arrival_rate)
+        self.active_flows: Dict[int, Flow] = {}
+        self.rr_order: List[int] = []
+        self.rr_index = 0
+        self.completed_flows: List[Tuple[int, float]] = []  # (size, fct)
+        self.rejected_flows = 0
+        self.sequential_ack_count = 0
+        self.timers = TimerWheel(self.start_time)  # retransmission timers of every flow, keyed (flow_id, seq_num)
+
+    def admit_arrivals(self, current_time: float) -> None:
+        while self.next_arrival_time <= current_time:
+            size = self.size_dist.sample(self.rng)
+            if len(self.active_flows) < self.max_active_flows:
+                flow = Flow(self.next_flow_id, size, self.strategy_factory(self.rng.randrange(1 << 30)),
+                            self.next_arrival_time)
+                flow.strategy.attach_timers(self.timers, flow.flow_id)
+                self.active_flows[flow.flow_id] = flow
+                self.rr_order.append(flow.flow_id)
+                self.next_flow_id += 1
+            else:
+                self.rejected_flows += 1
+            self.next_arrival_time += self.rng.expovariate(self.arrival_rate)
+
+    def next_packet_to_send(self) -> Optional[str]:
+        self.admit_arrivals(time.time())
+
+        for _ in range(len(self.rr_order)):
+            self.rr_index %= len(self.rr_order)
+            flow = self.active_flows[self.rr_order[self.rr_index]]
+            self.rr_index += 1
+            if not flow.has_data():
+                continue
+            serialized_data = flow.strategy.next_packet_to_send()
+            if serialized_data is None:
+                continue
+
+            data = json.loads(serialized_data)
+            data['flow_id'] = flow.flow_id
+            data['flow_size'] = flow.size
+            self.total_sent_packets += 1
+            return json.dumps(data)
+        return None
+
+    def process_ack(self, serialized_ack: str) -> None:
+        ack = json.loads(serialized_ack)
+        if ack.get('handshake'):
+            return
+
+        self.total_acks += 1
+        flow = self.active_flows.get(ack.get('flow_id'))
+        if flow is None:
+            # Late ACK for a flow that already completed
+            self.num_duplicate_acks += 1
+            return
+
+        strategy = flow.strategy
+        prev_ack_count = strategy.ack_count
+        prev_sequential = strategy.sequential_ack_count
+        strategy.process_ack(serialized_ack)
+
+        if strategy.ack_count > prev_ack_count:
+            self.ack_count += 1
+            self.sent_bytes += ack['ack_bytes']
+            self.rtts.append(strategy.rtts[-1])
+        else:
+            self.num_duplicate_acks += 1
+        self.sequential_ack_count += strategy.sequential_ack_count - prev_sequential
+        # Together, so the CWND series and its times stay paired
+        self.times_of_acknowledgements.append(((time.time() - self.start_time), ack['seq_num']))
+        self.cwnds.append(strategy.cwnd)
+
+        if flow.is_complete():
+            self.finish_flow(flow, time.time())
+
+    def check_timeouts(self, now: float) -> bool:
+        """Expire the shared wheel once and time out only the flows it names."""
+        timed_out = {flow_id for flow_id, _ in self.timers.advance(now)}
+        for flow_id in timed_out:
+            flow = self.active_flows.get(flow_id)
+            if flow is not None:
+                flow.strategy.retransmission_timeout(now)
+                self.timeouts += 1
+        return bool(timed_out)
+
+    def finish_flow(self, flow: Flow, current_time: float) -> None:
+        flow.finish_time = current_time
+        self.completed_flows.append((flow.size, current_time - flow.start_time))
+        del self.active_flows[flow.flow_id]
+        self.rr_order.remove(flow.flow_id)
+
+    def sequential_ack_ratio(self) -> float:
+        if self.total_acks == 0:
+            return 0.0
+        return self.sequential_ack_count / self.total_acks
+
+    def flow_completion_stats(self) -> Dict:
+        """FCT percentiles (ms) per size bucket, plus counts of unfinished flows."""
+        stats = {}
+        for name, low, high in FCT_BUCKETS:
+            fcts = [fct * 1000 for size, fct in self.completed_flows if low < size <= high]
+            stats[name] = {
+                'Count': len(fcts),
+                'Mean': round(sum(fcts) / len(fcts), 2) if fcts else None,
+                'P50': round(percentile(fcts, 50), 2) if fcts else None,
+                'P95': round(percentile(fcts, 95), 2) if fcts else None,
+                'P99': round(percentile(fcts, 99), 2) if fcts else None,
+            }
+        stats['Completed'] = len(self.completed_flows)
+        stats['Unfinished'] = len(self.active_flows)
+        stats['Rejected'] = self.rejected_flows
+        return stats
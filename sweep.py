@@ -0,0 +1,39 @@
+import json
+import argparse
+from src.settings import EXP_SETTINGS
+from src.fluid import *
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Screen Reno/Cubic configurations with the fluid model')
+    parser.add_argument('--setting', choices=list(EXP_SETTINGS), default='low')
+    parser.add_argument('--results', help='main.py results file to calibrate the fluid model against')
+    parser.add_argument('--duration', type=float, default=60.0)
+    parser.add_argument('--top', type=int, default=10)
+    parser.add_argument('--metric', default='Throughput')
+    parser.add_argument('--queues', nargs='+', choices=list(QUEUES), default=['droptail'])
+    args = parser.parse_args()
+
+    calibration = None
+    if args.results:
+        with open(args.results, 'r') as file:
+            calibration = calibrate(observed_means(json.load(file)), EXP_SETTINGS, duration=args.duration)
+        print(f"Calibration: {calibration}")
+
+    axes = {
+        'alg': [RENO, CUBIC],
+        'slow_start_thresh': [2, 5, 10, 20, 50, 100],
+        'initial_cwnd': [1, 2, 4, 10],
+        'C': [0.1, 0.2, 0.4, 0.8],
+        'queue_size': [13200, 26400, 52800, 105600],
+        'bandwidth_mbps': [10, 30, 100],
+        'queue': [QUEUES[q] for q in args.queues],
+    }
+    params, results = sweep(EXP_SETTINGS[args.setting], axes, calibration, duration=args.duration)
+    print(f"Simulated {len(params['alg'])} configurations")
+    for row in top_k(params, results, args.metric, args.top):
+        print({key: round(value, 2) for key, value in row.items()})
+
+
+if __name__ == '__main__':
+    main()